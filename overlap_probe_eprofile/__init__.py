@@ -1,4 +1,3 @@
-from __future__ import absolute_import
 # expose the package version
 from . import version
 
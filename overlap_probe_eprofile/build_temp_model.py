@@ -21,10 +21,10 @@ from collections import Counter
 import os
 import sys
 import re
-import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
 import more_itertools as mit
 
+from overlap_probe_eprofile.overlap_utils import config_to_namedtuple , read_config_file , read_overlap_file
+
 #-------------------------------------------------------------------------------
 
 class Temperature_model_builder ( object ) :
@@ -61,7 +61,9 @@ class Temperature_model_builder ( object ) :
 
         #self.all_available_files = [ f for f in np.sort ( os.listdir ( path_to_csvs ) ) if os.path.isfile ( path_to_csvs + f )  ] # might cause issues in case of LOM change
         
-        self.all_available_files_temp = [ f for f in np.sort ( os.listdir ( path_to_csvs ) ) if os.path.isfile ( path_to_csvs + f )  ]
+        with os.scandir ( path_to_csvs ) as entries :
+
+            self.all_available_files_temp = sorted ( e.name for e in entries if e.is_file ( ) )
 
         # Extraction of the dates from filenames
         pattern = r"\d{4}-\d{2}-\d{2}.csv"
@@ -103,25 +105,17 @@ class Temperature_model_builder ( object ) :
         
         '''
         
-        Read in a text file of settings / threshold values.  Currently 
+        Read in a text file of settings / threshold values and hold them 
         
-        saved as a Pandas dataframe, this will be changed to a named tuple in future
-        
-        for easier access.
+        as a named tuple, so that they can be read as attributes.
         
         '''
 
-        config_df = pd.read_csv ( config , sep = ',', skiprows = 1 , header = None )
-
-        config_df = config_df.transpose ( )
-
-        config_df.columns = config_df.iloc [ 0 ]
-
-        config_df = config_df.drop ( config_df.index [ 0 ] )  
+        config_df = read_config_file ( config )
         
-        self.ref_ov = np.asarray ( pd.read_csv ( self.ref_ov , sep = '\t' , skiprows = 1 , header = None , nrows = 1 ) ) [ 0 ]
+        self.ref_ov = read_overlap_file ( self.ref_ov )
         
-        self.config = config_df
+        self.config = config_to_namedtuple ( config_df )
    
         
     def check_dates_available ( self ) :
@@ -293,7 +287,7 @@ class Temperature_model_builder ( object ) :
             
             d = self.available_dts [ i ]
                        
-            if np.shape ( df ) [ 0 ] >= self.config [ 'min_nb_good_samples_after_outliers_removal' ].to_numpy()  :
+            if np.shape ( df ) [ 0 ] >= self.config.min_nb_good_samples_after_outliers_removal  :
             
                 ov , t = self._create_daly_median ( df )
             
@@ -396,7 +390,7 @@ class Temperature_model_builder ( object ) :
         
         self.diff_r2 [ 0 ] = 0
         
-        self.bool_run_len = list ( mit.run_length.encode ( abs ( self.diff_r2 )  < self.config ['thrsh_diff_r2'].values [ 0 ] ) )
+        self.bool_run_len = list ( mit.run_length.encode ( abs ( self.diff_r2 )  < self.config.thrsh_diff_r2 ) )
 
         max_true_count = -1
         
@@ -412,7 +406,7 @@ class Temperature_model_builder ( object ) :
   
         self.max_true_count = max_true_count
         
-        if self.max_true_count > self.config ['number_samples'].values [ 0 ] :
+        if self.max_true_count > self.config.number_samples :
             
             self.number_samples_flag = True
             
@@ -453,7 +447,7 @@ class Temperature_model_builder ( object ) :
 
         # --- mvh
         
-        if any ( abberations [ 0 ] ) : 
+        if abberations [ 0 ].any ( ) : 
         
             abberation_ind = np.max ( abberations )
         
@@ -469,7 +463,7 @@ class Temperature_model_builder ( object ) :
     
         # if not any ( grad_a_filtered < -0.7 ) and not any ( grad_a_filtered > 0.7 )  :
 
-        if not any ( self.alpha_2 [ ( self.rng >= 160 ) * ( self.rng <= 700 ) ] == 0 ):
+        if not ( self.alpha_2 [ ( self.rng >= 160 ) * ( self.rng <= 700 ) ] == 0 ).any ( ):
     
             self.artefact = False
             
@@ -521,6 +515,9 @@ class Temperature_model_builder ( object ) :
     
     def plot_regression_1 ( self ) :
         
+        import matplotlib.pyplot as plt
+        from matplotlib.dates import DateFormatter
+        
         params = {'legend.fontsize': 8,
     			  'axes.titlepad':10,
     			  'figure.figsize': (15, 5),
@@ -547,6 +544,8 @@ class Temperature_model_builder ( object ) :
                
     def plot_regression_2 ( self ) :
         
+        import matplotlib.pyplot as plt
+        
         params = {'legend.fontsize': 8,
     			  'axes.titlepad':10,
     			  'figure.figsize': (15, 5),
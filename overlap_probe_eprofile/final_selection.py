@@ -27,7 +27,7 @@ def get_ov_ok_info_df ( A_dict , rng ) :
     
     """ 
        
-    time_intervals  = [ np.repeat ( key , np.shape (  A_dict [ key ] [ 'data_frame' ] [ A_dict [ key ] ['data_frame'] [ 'pass_all'] == True ] ) [ 0 ] )  for key in A_dict.keys ( ) if  bool ( any (A_dict [ key ] ['data_frame'] ['pass_all'] ) ) ] 
+    time_intervals  = [ np.repeat ( key , np.shape (  A_dict [ key ] [ 'data_frame' ] [ A_dict [ key ] ['data_frame'] [ 'pass_all'] == True ] ) [ 0 ] )  for key in A_dict.keys ( ) if  A_dict [ key ] ['data_frame'] ['pass_all'].any ( ) ] 
     
     time_intervals = [ item for sublist in time_intervals for item in sublist ]
      
@@ -37,9 +37,11 @@ def get_ov_ok_info_df ( A_dict , rng ) :
     
     time_ints = np.asarray( list ( zip ( starts , ends ) ) )
 
-    ts = [ key for key in A_dict.keys ( ) if  bool ( any ( A_dict [ key ] ['data_frame'] ['pass_all'] ) ) ]
+    ts = [ key for key in A_dict.keys ( ) if  A_dict [ key ] ['data_frame'] ['pass_all'].any ( ) ]
     
-    ov_fcs = [ item for sublist in [  list ( A_dict [ key ] [ 'data_frame' ] [ A_dict [ key ] ['data_frame'] [ 'pass_all'] == True ].to_numpy ( ) [ : , 27 : ] )  for key in ts ] for item in sublist ]
+    ov_columns = list ( range ( len ( rng ) ) )
+
+    ov_fcs = [ item for sublist in [  list ( A_dict [ key ] [ 'data_frame' ].loc [ A_dict [ key ] ['data_frame'] [ 'pass_all'] == True , ov_columns ].to_numpy ( ) )  for key in ts ] for item in sublist ]
     
     temperatures = [ item for sublist in [ list ( A_dict [ key ] [ 'data_frame' ] [ A_dict [ key ] ['data_frame'] [ 'pass_all'] == True][ 'internal_temperature'] ) for key in ts ] for item in sublist ]
     
@@ -82,7 +84,7 @@ def make_deep_signal ( dt , times , RCSc ) :
      
      time_window_inds = np.sort ( time_window_inds.reshape ( np.shape ( times ) [ 0 ] , profiles_per_time_window  ) ) 
      
-     deep_signal = np.rollaxis ( RCSc [ time_window_inds , : ] , 0 , 3 ).astype('float32')
+     deep_signal = np.rollaxis ( RCSc [ time_window_inds , : ] , 0 , 3 ).astype('float32', copy=False)
 
      return deep_signal
  
@@ -101,7 +103,7 @@ def make_variance_windows ( dt , times , config ) :
     
     '''
     
-    dt_sliding_variance=  int ( config [ 'dt_sliding_variance' ].iloc [ 0 ] )
+    dt_sliding_variance=  int ( config.dt_sliding_variance )
     
     deep_time = np.repeat ( dt [ : , np.newaxis ] , np.shape ( times ) [ 0 ] , axis = 1 )
     
@@ -129,23 +131,23 @@ def check_rel_grad_magn ( rng  , max26, ov_fcs , times , deep_signal , config ):
     
     stack_size = np.shape ( ov_fcs ) [ 0 ]
       
-    deep_signal = np.tile ( deep_signal , stack_size  ).astype('float32')
+    deep_signal = np.tile ( deep_signal , stack_size  ).astype('float32', copy=False)
     
-    ovs_to_test = np.repeat ( ov_fcs , np.shape ( times ) [ 0 ] , axis = 0).astype('float32')
+    ovs_to_test = np.repeat ( ov_fcs , np.shape ( times ) [ 0 ] , axis = 0).astype('float32', copy=False)
     
-    deep_signal = np.asarray ( abs ( deep_signal / ovs_to_test.T ) ).astype('float32')
+    deep_signal = np.asarray ( abs ( deep_signal / ovs_to_test.T ) ).astype('float32', copy=False)
       
     del ovs_to_test
     
     gc.collect ( )
     
-    lcc = np.log10 ( deep_signal  ).astype('float32')
+    lcc = np.log10 ( deep_signal  ).astype('float32', copy=False)
                
-    gradY = ( conv3d (  lcc , direction =  'y' ) ).astype('float32')
+    gradY = ( conv3d (  lcc , direction =  'y' ) ).astype('float32', copy=False)
 
-    gradX = ( conv3d ( lcc , direction = 'x' ) ).astype('float32')
+    gradX = ( conv3d ( lcc , direction = 'x' ) ).astype('float32', copy=False)
     
-    gradY =  ( ( np.sqrt ( gradX ** 2 + gradY ** 2 ) / abs ( lcc ) ) ).astype('float32')
+    gradY =  ( ( np.sqrt ( gradX ** 2 + gradY ** 2 ) / abs ( lcc ) ) ).astype('float32', copy=False)
     
     del gradX
     
@@ -163,13 +165,13 @@ def check_rel_grad_magn ( rng  , max26, ov_fcs , times , deep_signal , config ):
     
     a = np.tile( a, stack_size )
     
-    for i , j in enumerate (a) :
-        
-        gradmax [j-1:,i] = np.nan
+    rows = np.arange ( np.shape ( gradmax ) [ 0 ] ) [ : , np.newaxis ]
+    
+    gradmax [ rows >= a - 1 ] = np.nan
                 
-    con1 =  (np.nanmax ( gradmax [  1:-1 , : ]  , axis = 0 )  <=  config [ 'max_relgrad' ].to_numpy ( ) ).astype(bool)
+    con1 =  (np.nanmax ( gradmax [  1:-1 , : ]  , axis = 0 )  <=  config.max_relgrad ).astype(bool)
   
-    con2 = ( np.nanmean ( np.nanmean ( gradY [ 1:-1 , 1:-1 , : ] , axis = 1 ),axis = 0 ) <= config [ 'max_relgrad_mean' ].to_numpy ( ) ).astype(bool)
+    con2 = ( np.nanmean ( np.nanmean ( gradY [ 1:-1 , 1:-1 , : ] , axis = 1 ),axis = 0 ) <= config.max_relgrad_mean ).astype(bool)
    
     con1 = np.multiply.reduceat ( con1 , np.arange ( 0 , len ( con1 ) , np.shape ( times ) [ 0 ] ) ).astype(bool)
     
@@ -187,30 +189,30 @@ def check_variance ( signal  , ov_fcs , times , dt  , config )  :
     
     stack_size = np.shape ( ov_fcs ) [ 0 ]
       
-    signal = np.tile ( signal , stack_size  ).astype('float32')
+    signal = np.tile ( signal , stack_size  ).astype('float32', copy=False)
     
-    ovs_to_test = np.repeat ( ov_fcs , np.shape ( times ) [ 0 ] , axis = 0).astype('float32')
+    ovs_to_test = np.repeat ( ov_fcs , np.shape ( times ) [ 0 ] , axis = 0).astype('float32', copy=False)
     
-    signal = np.log10 ( np.asarray ( abs ( signal / ovs_to_test.T ) ) ).astype('float32')
+    signal = np.log10 ( np.asarray ( abs ( signal / ovs_to_test.T ) ) ).astype('float32', copy=False)
     
-    sliding_window_inds = make_variance_windows ( dt , times , config ).astype('int32')
+    sliding_window_inds = make_variance_windows ( dt , times , config ).astype('int32', copy=False)
     
-    denomenator =  np.nanmedian ( signal , axis = 0 ).astype('float32')
+    denomenator =  np.nanmedian ( signal , axis = 0 ).astype('float32', copy=False)
             
-    variance = stdomean (sliding_window_inds , signal , denomenator , np.shape ( ov_fcs ) [ 0 ] ,  np.shape ( times ) [ 0 ] ).astype('float32')  
+    variance = stdomean (sliding_window_inds , signal , denomenator , np.shape ( ov_fcs ) [ 0 ] ,  np.shape ( times ) [ 0 ] ).astype('float32', copy=False)  
        
-    condition = np.nanmax ( variance , axis = 0 )  <  config [ 'max_std_over_mean' ].to_numpy ( )
+    condition = np.nanmax ( variance , axis = 0 )  <  config.max_std_over_mean
     
     return condition
     
    
 def stdomean (sliding_window_inds , deep_signal , denomenator , ov_shape ,  times_shape  ):
     
-    variance = np.zeros( ( np.shape ( sliding_window_inds ) [ 0 ] ,  ov_shape ) ).astype('float32')
+    variance = np.zeros( ( np.shape ( sliding_window_inds ) [ 0 ] ,  ov_shape ) , dtype = 'float32' )
     
     for sw in range ( np.shape ( sliding_window_inds ) [ 0 ]  ) :
         
-        v = np.nanstd (deep_signal [ sliding_window_inds [ sw ] , : , : ] ,  axis = 0 ) / denomenator
+        v = np.nanstd (deep_signal [ sliding_window_inds [ sw , 0 ] : sliding_window_inds [ sw , -1 ] + 1 , : , : ] ,  axis = 0 ) / denomenator
              
         v = np.maximum.reduceat ( v.T , np.arange ( 0 , np.shape ( v ) [ 1 ] , times_shape ) )
         
@@ -231,11 +233,11 @@ def do_sort_checks ( results_dict , dt , rng , rcs , ov , config ) :
         
         return False
     
-    if np.shape ( ov_fcs ) [ 0 ] <= config [ 'min_nb_samples_for_skipping_good_test' ].values [ 0 ] :
+    if np.shape ( ov_fcs ) [ 0 ] <= config.min_nb_samples_for_skipping_good_test :
       
         RCSc = rcs * ov 
            
-        range_index = ( rng >= config [ 'min_range_std_over_mean' ].values [ 0 ] ) * ( rng <= np.max ( max_rng ) )
+        range_index = ( rng >= config.min_range_std_over_mean ) * ( rng <= np.max ( max_rng ) )
         
         RCSc = RCSc [ : , range_index ]
         
@@ -249,7 +251,7 @@ def do_sort_checks ( results_dict , dt , rng , rcs , ov , config ) :
         
         condition2 = check_rel_grad_magn ( rng  , max26 , ov_fcs  , times , deep_signal , config )
         
-        print ('No. of corrected overlap functions after good tests = ' , sum ( condition1 * condition2 ) )
+        print ('No. of corrected overlap functions after good tests = ' , np.count_nonzero ( condition1 * condition2 ) )
           
         return condition1 * condition2
     
@@ -298,23 +300,9 @@ def remove_failed ( results_dict , passed_inds , rng  , config ) :
     
 def remove_outliers (  ovs , rng , config ) :
     
-    whiskers = config [ 'whiskers_length' ].to_numpy()
-    
-    pc_25 = []
-    pc_75 = []
-    pc_50 = []
+    whiskers = config.whiskers_length
     
-    for idx in range( 0 , len(rng) ) :
-           
-        pc_25.append ( prctile ( np.asarray ( ovs [ : , idx ] ,dtype='float64') , 25 ) )
-        
-        pc_75.append ( prctile ( np.asarray ( ovs [ : , idx ] ,dtype='float64') , 75 ) )
-        
-        pc_50.append ( prctile ( np.asarray ( ovs [ : , idx ] ,dtype='float64') , 50 ) )
-        
-    pc_25 = np.asarray (  pc_25 )
-    pc_75 = np.asarray (  pc_75 )
-    pc_50 = np.asarray (  pc_50 )   
+    pc_25 , pc_75 , pc_50 = prctile ( np.asarray ( ovs [ : , : len ( rng ) ] , dtype = 'float64' ) , [ 25 , 75 , 50 ] , axis = 0 )
    
     outliers_plus = pc_50 + whiskers*(pc_75-pc_25)
             
@@ -326,7 +314,7 @@ def remove_outliers (  ovs , rng , config ) :
 
     for r , ov_func in enumerate ( ovs ) :
 
-        if  not (  ( any ( ovs [ r , : ]  < outliers_minus ) ) | ( any ( ovs [ r , : ] > outliers_plus ) ) ) :
+        if  not (  ( ovs [ r , : ]  < outliers_minus ).any ( ) | ( ovs [ r , : ] > outliers_plus ).any ( ) ) :
             
             ov_final = np.vstack ( ( ov_final , ov_func ) )
             
@@ -19,11 +19,11 @@ The checks are then performed on this masked array in one operation.
 
 import numpy as np
 import scipy.signal as ss
+import functools
+from scipy.ndimage import convolve1d
 from copy import deepcopy
-from overlap_probe_eprofile.overlap_utils import create_results_df, conv3d , simple_linear_fit
+from overlap_probe_eprofile.overlap_utils import create_results_df, relative_gradient_magnitude , simple_linear_fit
 
-np.seterr(divide = 'ignore') 
-np.seterr(invalid = 'ignore')
 
 
 def check_fits ( rcs_0 , rng , max_available_fit_range , config ) :
@@ -55,7 +55,7 @@ def check_fits ( rcs_0 , rng , max_available_fit_range , config ) :
         range array for CHM15k
     max_available_fit_range : float
         maximum altitude at which all pre_checks were passed
-    config : pandas data frame
+    config : named tuple
         thresholds and setting        
     
     Returns
@@ -86,33 +86,25 @@ def check_fits ( rcs_0 , rng , max_available_fit_range , config ) :
     
     """
     
-    signal_all = np.nanmean ( np.log10 ( abs ( rcs_0 ) ) , axis = 0 )
+    with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
+    
+        signal_all = np.nanmean ( np.log10 ( abs ( rcs_0 ) ) , axis = 0 )
        
-    fl = np.asarray ( np.arange ( config [ 'min_fit_length' ].values [ 0 ] , config [ 'max_fit_length' ].values [ 0 ] , config [ 'd_fit_length' ].values [ 0 ] ) )
+    fl = np.asarray ( np.arange ( config.min_fit_length , config.max_fit_length , config.d_fit_length ) )
     
-    fb = np.asarray (  np.arange ( config [ 'min_fit_range' ].values [ 0 ] , float ( max_available_fit_range ) , config [ 'd_fit_range' ].values [ 0 ] ) )
+    fb = np.asarray (  np.arange ( config.min_fit_range , float ( max_available_fit_range ) , config.d_fit_range ) )
     
-    top_mask , bottom_mask , n  = make_mask ( fl , fb , rng )
+    top_mask , bottom_mask , n , masked_rng = _fitting_windows ( tuple ( fl ) , tuple ( fb ) , tuple ( rng ) )
     
-    mask = np.array ( top_mask + bottom_mask, dtype = bool ) 
+    mask = np.ma.getmaskarray ( masked_rng )
     
     deep_signal = np.repeat ( signal_all [ : , np.newaxis ], np.shape ( mask ) [ 1 ] , axis = 1 )
     
-    deep_rng = np.repeat ( rng [ : , np.newaxis ], np.shape ( mask ) [ 1 ] , axis = 1 )
-    
-    masked_signal = np.ma.masked_array ( deep_signal , mask=mask )
-    
-    mask_for_whole_zone = ( top_mask == 1 ) & (deep_rng <= config [ 'min_fit_range' ].values [ 0 ] )
-    
-    masked_signal_whole_zone = np.ma.masked_array ( deep_signal , mask=mask_for_whole_zone )
-    
-    masked_rng = np.ma.masked_array ( deep_rng , mask=mask )
-    
-    masked_rng_whole_zone = np.ma.masked_array ( deep_rng , mask=mask_for_whole_zone )
+    masked_signal = np.ma.masked_array ( deep_signal , mask = mask.copy ( ) )
     
     p = simple_linear_fit ( n , masked_rng , masked_signal )  
     
-    poly , resid , resid_whole_zone = get_regression_residuals ( p , masked_signal , masked_signal_whole_zone , masked_rng , masked_rng_whole_zone , n )
+    poly , resid , resid_whole_zone = get_regression_residuals ( p , masked_signal , masked_rng , n )
     
     condition1 = _check_conditions_1 ( p , poly , resid , resid_whole_zone , config)
     
@@ -143,7 +135,7 @@ def check_relative_error ( rcs_0 , p , ov , rng , top_mask , config , condition1
         range array for CHM15k
     top_mask : 2D array of bools
         mask defining the upper bounds of the the altitude windows
-    config : pandas data frame
+    config : named tuple
         thresholds and setting  
     condition1 : boolean array
         results of checks performed by check_fits
@@ -171,7 +163,9 @@ def check_relative_error ( rcs_0 , p , ov , rng , top_mask , config , condition1
     
     if np.sum ( condition1 ) > 0 :
     
-        signal_all = np.nanmean ( np.log10 ( abs ( rcs_0 ) ) , axis = 0 )
+        with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
+        
+            signal_all = np.nanmean ( np.log10 ( abs ( rcs_0 ) ) , axis = 0 )
         
         overlap_corr_factor , ovp_fc , valmax = make_ovp_fc ( signal_all , p , ov , rng , top_mask , config )  
         
@@ -185,9 +179,9 @@ def check_relative_error ( rcs_0 , p , ov , rng , top_mask , config , condition1
         
         return fill , fill , fill  , fill
 
-def check_temporal_spatial_homogeneity ( rcs_0 , rng , overlap_corr_factor , top_mask , max_available_fit_range , config, condition2 ) :
+def check_temporal_spatial_homogeneity ( rcs_0 , rng , overlap_corr_factor , top_mask , max_available_fit_range , config, condition2 , n_jobs = -1 ) :
     
-    """Calls conv3d to find the spatio-temporal gradients of the corrected
+    """Calls relative_gradient_magnitude to find the spatio-temporal gradients of the corrected
     signal found using the candidate corrected overlap functions, and then checks 
     the maximum and mean are less than 'max_relgrad' and  'max_relgrad_mean' as
     defined in config.
@@ -211,8 +205,10 @@ def check_temporal_spatial_homogeneity ( rcs_0 , rng , overlap_corr_factor , top
         maximum altitude at which all pre_checks were passed
     condition1 : array of bools
         profiles that have passed checks so far
-    config : pandas data frame
+    config : named tuple
         thresholds and setting 
+    n_jobs : int
+        number of threads for relative_gradient_magnitude, -1 for one per CPU
     
     Returns
     -------
@@ -226,30 +222,23 @@ def check_temporal_spatial_homogeneity ( rcs_0 , rng , overlap_corr_factor , top
         gradient of input signal along "direction""        
     See also
     --------
+    overlap_probe_eprofile.overlap_utils.relative_gradient_magnitude
     overlap_probe_eprofile.overlap_utils.conv3d
     
     """
     if np.sum ( condition2 ) > 0 :
         
-        np.seterr(divide='ignore')
-       
-        index_range_for_grad = ( rng >= config [ 'min_range_std_over_mean' ].values [ 0 ] ) * ( rng < max_available_fit_range )
+        index_range_for_grad = slice ( np.searchsorted ( rng , config.min_range_std_over_mean ) , np.searchsorted ( rng , max_available_fit_range ) )
          
-        deep_rcs_0 = np.repeat ( rcs_0.T [ index_range_for_grad , : , np.newaxis ] , np.shape ( top_mask ) [ 1 ] , axis = 2 )
-        
-        deep_rcs_0 = deep_rcs_0 [ : , : , condition2 ]
+        deep_rcs_0 = rcs_0.T [ index_range_for_grad , : , np.newaxis ]
         
-        deep_overlap_corr_factor = np.repeat ( overlap_corr_factor [ index_range_for_grad , np.newaxis , : ], np.shape ( rcs_0.T ) [ 1 ] , axis = 1 )
+        deep_overlap_corr_factor = overlap_corr_factor [ index_range_for_grad , np.newaxis , condition2 ]
         
-        deep_overlap_corr_factor = deep_overlap_corr_factor [ : , : , condition2 ]
+        with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
         
-        signal_for_grad_check =   np.log10 ( abs ( deep_rcs_0 ) / deep_overlap_corr_factor  ) 
+            signal_for_grad_check =   np.log10 ( abs ( deep_rcs_0 ) / deep_overlap_corr_factor  ) 
         
-        gradY = conv3d (  signal_for_grad_check , direction =  'y' )
-    
-        gradX = conv3d (  signal_for_grad_check , direction = 'x' )
-    
-        relgradmagn = np.sqrt ( gradX  ** 2 + gradY  ** 2 ) / abs ( signal_for_grad_check )
+        relgradmagn = relative_gradient_magnitude ( signal_for_grad_check , n_jobs = n_jobs )
     
         new_elements_to_mask = np.argmax  ( top_mask , axis = 0 ) 
         
@@ -311,7 +300,7 @@ def check_monotonic ( ovp_fc , rng , top_mask,  config , condition3 ) :
         range array for CHM15k
     top_mask : 2D array of bools
         mask defining the upper bounds of the the fitting windows
-    config : pandas data frame
+    config : named tuple
         thresholds and setting 
     
     Returns
@@ -328,7 +317,7 @@ def check_monotonic ( ovp_fc , rng , top_mask,  config , condition3 ) :
     
     if np.sum ( condition3 ) > 0 :
    
-        slope = ss.savgol_filter ( ovp_fc [ : 167 , : ] , window_length = int ( config [ 'sgolay_width' ].values [ 0 ] ) , polyorder = int ( config [ 'sgolay_ord' ].values [ 0 ] ) , axis = 0 , deriv = 1 , delta = rng [ 1 ] - rng [ 0 ] )
+        slope = _savgol_derivative ( ovp_fc [ : 167 , : ] , int ( config.sgolay_width ) , int ( config.sgolay_ord ) , rng [ 1 ] - rng [ 0 ] )
        
         val_min_slope = np.nanmin  ( slope , axis = 0)
         
@@ -381,30 +370,56 @@ def make_mask ( fit_length , fit_begin , rng ) :
 
     wbmax = fit_begin [ -1 ]
        
-    wbegin = np.repeat ( fit_begin  , len ( fit_length ) )
+    wbegin , wlen = np.meshgrid ( fit_begin , fit_length , indexing = 'ij' )
        
-    wlen = np.tile ( fit_length  , len ( fit_begin )  )
+    wbegin = wbegin.ravel ( )
        
-    wstop = wbegin + wlen
+    wstop = wbegin + wlen.ravel ( )
+    
+    valid = wstop <= wbmax
 
-    wbegin = np.delete ( wbegin , np.where ( wstop  > wbmax  ) )
+    wbegin = wbegin [ valid ]
         
-    wstop = np.delete ( wstop , np.where ( wstop  > wbmax  ) )
+    wstop = wstop [ valid ]
     
-    deep_rng = np.repeat ( rng [ : , np.newaxis ] , len ( wstop ) , axis = 1 )
+    bottom_mask = ( rng [ : , np.newaxis ] < wbegin ) 
     
-    bottom_mask = ( deep_rng < wbegin ) 
-    
-    top_mask =  ( deep_rng >  wstop )
+    top_mask =  ( rng [ : , np.newaxis ] >  wstop )
     
     n =  len ( rng ) - np.sum ( bottom_mask + top_mask , axis = 0 )
                
     return top_mask , bottom_mask , n 
 
-def get_regression_residuals ( p , masked_signal , masked_signal_whole_zone , masked_rng , masked_rng_whole_zone , n ) :
+@functools.lru_cache ( maxsize = 16 )
+def _fitting_windows ( fit_length , fit_begin , rng ) :
+    
+    """Cached make_mask, also returning the range array masked outside each 
+    fitting window. The arguments are tuples so they can key the cache: rng and 
+    the fit lengths never change between time windows and fit_begin only 
+    depends on max_available_fit_range, so most windows reuse an earlier result.
+    The returned arrays are shared between calls and are made read only.
+    """
+    
+    rng = np.asarray ( rng )
+    
+    top_mask , bottom_mask , n = make_mask ( np.asarray ( fit_length ) , np.asarray ( fit_begin ) , rng )
+    
+    deep_rng = np.broadcast_to ( rng [ : , np.newaxis ] , np.shape ( top_mask ) )
+    
+    masked_rng = np.ma.masked_array ( deep_rng , mask = top_mask | bottom_mask )
+    
+    for a in ( top_mask , bottom_mask , n , masked_rng.mask ) :
+        
+        a.flags.writeable = False
+    
+    return top_mask , bottom_mask , n , masked_rng
+
+def get_regression_residuals ( p , masked_signal , masked_rng , n ) :
     
     """Returns the sum of the squares of the residuals and the max of the abs. values of the 
-    residuals between the regression line returned by simple_linear_fit and the mean log signal. 
+    relative residuals between the regression line returned by simple_linear_fit and the mean 
+    log signal. Both are taken over the unmasked values of masked_signal, i.e. within each 
+    altitude window.
     
     Parameters
     ----------
@@ -414,14 +429,8 @@ def get_regression_residuals ( p , masked_signal , masked_signal_whole_zone , ma
     masked_signal : 2D masked array
         the repeated mean log signal for the current time window masked where values
         are outside the altitude windows defined by fit_begin and fit_length
-    masked_signal_whole_zone : 2D masked array
-        the repeated mean log signal for the current time window masked where values
-        are outside the altitude windows defined by fit_begin and fit_length but 
-        extended downwards so all windows begin at 'min_fit_range'
     masked_rng : 2D array
         the repeated range array masked to match masked_signal
-    masked_rng__whole_zone : 2D array
-        the repeated range array maked to match masked_signal_whole_zone
     n : array of int
         total lengths of each unmasked windows in masked_signal
         
@@ -442,12 +451,12 @@ def get_regression_residuals ( p , masked_signal , masked_signal_whole_zone , ma
     """
     
     poly = p [ 0 ] + p [ 1 ] * masked_rng
-       
-    poly_whole_zone = p [ 0 ] + p [ 1 ] * masked_rng_whole_zone
+    
+    residuals = masked_signal - poly
                     
-    resid = np.sqrt ( ( 1 /  n  ) * np.ma.sum ( ( masked_signal - poly ) ** 2 , axis = 0 ) )
+    resid = np.sqrt ( ( 1 /  n  ) * np.ma.sum ( residuals ** 2 , axis = 0 ) )
       
-    resid_whole_zone = np.ma.max ( abs ( masked_signal - poly_whole_zone ) / abs ( poly_whole_zone ) , axis = 0 )
+    resid_whole_zone = np.ma.max ( abs ( residuals ) / abs ( poly ) , axis = 0 )
         
     return poly , resid , resid_whole_zone
     
@@ -473,7 +482,7 @@ def make_ovp_fc ( signal_all , p , ov , rng , top_mask , config ) :
         range array for CHM15k
     top_mask : 2D array of bools
         mask defining the upper bounds of the the altitude windows
-    config : pandas data frame
+    config : named tuple
         thresholds and setting 
         
     Returns
@@ -492,96 +501,138 @@ def make_ovp_fc ( signal_all , p , ov , rng , top_mask , config ) :
         
     """
         
-    signal_all = np.repeat ( signal_all [ : , np.newaxis ] , np.shape ( top_mask ) [ 1 ] , axis = 1 )
-    
-    deep_rng = np.repeat ( rng [ : , np.newaxis ] , np.shape ( top_mask ) [ 1 ] , axis = 1 )
-    
-    deep_ov = np.repeat ( ov [ : , np.newaxis ] , np.shape ( top_mask ) [ 1 ] , axis = 1 )
-    
-    poly_all = p [ 0 ] + p [ 1 ] * deep_rng
+    poly_all = p [ 0 ] + p [ 1 ] * rng [ : , np.newaxis ]
 
-    diff = signal_all - poly_all
+    diff = signal_all [ : , np.newaxis ] - poly_all
     
     overlap_corr_factor = 10 ** diff
     
     overlap_corr_factor [ ( top_mask == 1 ) ] = 1
     
-    ovp_fc = deep_ov * overlap_corr_factor
+    ovp_fc = ov [ : , np.newaxis ] * overlap_corr_factor
+    
+    i_min_overlap_valid = np.searchsorted ( rng , config.min_overlap_valid )
     
-    min_overlap_valid = config [ 'min_overlap_valid' ].values [ 0 ]
+    ov_valid = ov [ i_min_overlap_valid : , np.newaxis ]
     
-    rel_err =  abs ( deep_ov [ rng >= min_overlap_valid , : ] - ovp_fc [ rng >= min_overlap_valid , : ] )  / abs ( deep_ov [ rng >= min_overlap_valid , : ] ) 
+    rel_err =  abs ( ov_valid - ovp_fc [ i_min_overlap_valid : , : ] )  / abs ( ov_valid ) 
     
     valmax = np.nanmax ( rel_err , axis = 0 ) 
     
     return overlap_corr_factor , ovp_fc , valmax 
 
 
+@functools.lru_cache ( maxsize = 8 )
+def _savgol_derivative_coeffs ( window_length , polyorder , delta ) :
+    
+    """Savitzky–Golay first derivative coefficients for the interior of the 
+    signal and for the window_length // 2 points at each edge, which 
+    scipy.signal.savgol_filter (mode = 'interp') fits separately. These only 
+    depend on settings from config so are computed once and reused.
+    """
+    
+    half = window_length // 2
+    
+    kernel = ss.savgol_coeffs ( window_length , polyorder , deriv = 1 , delta = delta )
+    
+    edges = np.asarray ( [ ss.savgol_coeffs ( window_length , polyorder , deriv = 1 , delta = delta , pos = pos , use = 'dot' ) for pos in range ( window_length ) ] )
+    
+    return kernel , edges [ : half , : ] , edges [ half + 1 : , : ]
+
+def _savgol_derivative ( x , window_length , polyorder , delta ) :
+    
+    """Equivalent to scipy.signal.savgol_filter ( x , window_length , polyorder , 
+    deriv = 1 , delta = delta , axis = 0 ) using the cached coefficients from 
+    _savgol_derivative_coeffs
+    """
+    
+    kernel , left , right = _savgol_derivative_coeffs ( window_length , polyorder , float ( delta ) )
+    
+    half = window_length // 2
+    
+    x = np.asarray ( x , dtype = float )
+    
+    slope = convolve1d ( x , kernel , axis = 0 , mode = 'constant' )
+    
+    slope [ : half , : ] = left @ x [ : window_length , : ]
+    
+    slope [ -half : , : ] = right @ x [ -window_length : , : ]
+    
+    return slope
+
 def _check_conditions_1 ( p , poly , resid , resid_whole_zone , config ) :
        
-    con1 = ( p [ 1 ] >= config [ 'min_expected_slope' ].values [ 0 ] )
+    con1 = ( p [ 1 ] >= config.min_expected_slope )
     
-    con2 = ( p [ 1 ] <= config [ 'max_expected_slope' ].values [ 0 ] ) 
+    con2 = ( p [ 1 ] <= config.max_expected_slope ) 
                     
-    con3 = ( p [ 0 ] >= config [ 'min_expected_zero_fit_value' ].values [ 0 ] )
+    con3 = ( p [ 0 ] >= config.min_expected_zero_fit_value )
       
-    con4 = ( p [ 0 ] <= config [ 'max_expected_zero_fit_value' ].values [ 0 ] )
+    con4 = ( p [ 0 ] <= config.max_expected_zero_fit_value )
     
-    con5 =  ( resid < config [ 'thresh_resid_rel' ].values [ 0 ] * np.ma.mean ( poly , axis = 0) )
+    con5 =  ( resid < config.thresh_resid_rel * np.ma.mean ( poly , axis = 0) )
     
-    con6 = ( resid_whole_zone < config [ 'thresh_resid_whole_zone' ].values [ 0 ] )
+    con6 = ( resid_whole_zone < config.thresh_resid_whole_zone )
     
-    condition1 = con1 * con2 * con3 * con4 * con5 * con6 
+    condition1 = con1
+    
+    for con in ( con2 , con3 , con4 , con5 , con6 ) :
+        
+        condition1 &= con
     
     return condition1
 
 def _check_conditions_2 ( ovp_fc , ov , valmax , config ) :
     
-    con7 = ( ( np.nanmax ( ovp_fc , axis = 0 ) ) <= config [ 'max_overlap_value' ].values [ 0 ]  * np.nanmax ( ov , axis = 0) )
+    con7 = ( ( np.nanmax ( ovp_fc , axis = 0 ) ) <= config.max_overlap_value  * np.nanmax ( ov , axis = 0) )
      
-    con8 = ( valmax < config [ 'thresh_overlap_valid_rel_error' ].values [ 0 ] )
+    con8 = ( valmax < config.thresh_overlap_valid_rel_error )
     
-    condition2 =  con7 * con8
+    condition2 =  con7 & con8
     
     return condition2
 
 def _check_conditions_3 ( relgradmagn  , config ) :
     
-    relgradmagn = np.ma.masked_invalid ( relgradmagn )
+    relgradmagn = np.ma.filled ( relgradmagn , np.nan )
+    
+    valid = np.isfinite ( relgradmagn )
     
-    relgrad_max = np.ma.max ( np.ma.max ( relgradmagn , axis = 1 ) , axis = 0 )
+    relgradmagn [ ~ valid ] = np.nan
+    
+    relgrad_max = np.nanmax ( relgradmagn , axis = ( 0 , 1 ) )
+
+    with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
 
-    relgrad_mean = np.ma.mean ( np.ma.mean ( relgradmagn , axis = 1 ) , axis = 0 )
+        relgrad_mean = np.nanmean ( np.nansum ( relgradmagn , axis = 1 ) / np.sum ( valid , axis = 1 ) , axis = 0 )
     
-    con9 = ( relgrad_max  <=  config [ 'max_relgrad' ].to_numpy ( ) )
+    con9 = ( relgrad_max  <=  config.max_relgrad )
        
-    con10 = ( relgrad_mean <= config [ 'max_relgrad_mean' ].to_numpy ( ) ) 
+    con10 = ( relgrad_mean <= config.max_relgrad_mean ) 
                         
-    condition3 = con9 * con10
+    condition3 = con9 & con10
        
     return relgrad_max , relgrad_mean , condition3
 
 def _check_condtions_4 ( val_min_slope , index_min_slope , index_range_stop_correction , config ) :
        
-    val_min_slope = np.ma.masked_invalid ( val_min_slope ) 
-    
-    index_min_slope = np.ma.masked_invalid ( index_min_slope )
+    valid = np.isfinite ( val_min_slope )
     
-    con11 = ( val_min_slope >= config [ 'min_slope' ].to_numpy ( ) ) 
+    con11 = ( val_min_slope >= config.min_slope ) 
     
-    con12 =  ( index_min_slope > index_range_stop_correction )
+    con12 =  ( index_min_slope > index_range_stop_correction ) & valid
 
-    condition4 = con11 + con12
+    condition4 = con11 | con12
     
     return condition4
     
-def do_quality_checks ( rcs_0 , rng , internal_temperature , max_available_fit_range , config , ov ) :
+def do_quality_checks ( rcs_0 , rng , internal_temperature , max_available_fit_range , config , ov , n_jobs = -1 ) :
 
     p , poly , resid , resid_whole_zone, top_mask , bottom_mask,  condition1 = check_fits ( rcs_0 , rng , max_available_fit_range , config ) 
     
     ovp_fc , overlap_corr_factor , valmax ,  condition2 = check_relative_error ( rcs_0  , p , ov , rng , top_mask , config , condition1 )
         
-    relgradmagn , relgrad_max , relgrad_mean , condition3 = check_temporal_spatial_homogeneity ( rcs_0 , rng , overlap_corr_factor , top_mask , max_available_fit_range ,  config , condition2 )    
+    relgradmagn , relgrad_max , relgrad_mean , condition3 = check_temporal_spatial_homogeneity ( rcs_0 , rng , overlap_corr_factor , top_mask , max_available_fit_range ,  config , condition2 , n_jobs = n_jobs )    
 
     val_min_slope , index_min_slope , condition4 = check_monotonic ( ovp_fc , rng , top_mask , config , condition3 ) 
     
@@ -12,74 +12,8 @@ Rolf Ruefenacht and Melania Van Hove.
 """
 
 import numpy as np
-import datetime
 from overlap_probe_eprofile.overlap_utils import conv2d
 
-def at_least_one_profile ( flag ) :
-
-    """Part 1 of the checks described in section 1 of the appendix of 
-    `amt-9-2947-2016 <https://amt.copernicus.org/articles/9/2947/2016/amt-9-2947-2016.pdf>`_
-    Check there is at least one profile within the current time window. 
-    
-    Parameters
-    ----------
-    
-    flag : array of bools
-        Boolean array indicating which profiles are to be ignored as filled
-        missing data
-        
-    Returns
-    -------
-    
-    Result : bool
-        True or False for pass or fail
-        
-        
-    See also
-    --------
-    overlap_probe_eprofile.process_L1.Eprofile_Reader.fill_gaps
-
-    """
-
-    return ~np.all ( flag )
-
-def all_clear_sky ( check , sci ) :
-
-    """Part 2 of the checks described in section 1 of the appendix of 
-    `amt-9-2947-2016 <https://amt.copernicus.org/articles/9/2947/2016/amt-9-2947-2016.pdf>`_
-    
-    Check all profiles in current time window come with a clear sky condition. 
-    
-    Parameters
-    ----------
-    
-    check : bool
-        result of first check ( at_least_one_profile )
-    
-    sci : list of ints
-        sky conditions for each profile
-        
-    Returns
-    -------
-    
-    Result : bool
-        True or False for pass or fail
-        
-        
-    See also
-    --------
-    overlap_probe_eprofile.pre_checks.at_least_one_profile
-
-    """
-
-    if check :
-
-        return np.all ( sci == 0)
-
-    else :
-
-        return False
-
 def enough_clear_range_cbi ( check ,  cbi , config ) :
 
     """Checks described in section 2 of the appendix of 
@@ -94,10 +28,11 @@ def enough_clear_range_cbi ( check ,  cbi , config ) :
     ----------
     
     check : bool
-        result of all_clear_sky test
+        result of the first two checks, made from running counts of the 
+        missing and not clear sky profiles in Eprofile_Reader._check_window
     cbi : array of floats
         cloud base heights for current time window  
-    config : class attribute
+    config : named tuple
         contains settings and thresholds
     
     Returns
@@ -109,21 +44,23 @@ def enough_clear_range_cbi ( check ,  cbi , config ) :
         
     See also
     --------
-    overlap_probe_eprofile.pre_checks.all_clear_sky
+    overlap_probe_eprofile.process_L1.Eprofile_Reader._check_window
 
     """
 
     if check:
 
-        cbi [ cbi < 0 ] = 15000
+        max_fit_range = config.max_fit_range
+
+        min_fit_top = config.min_fit_range + config.min_fit_length
 
-        max_fit_range = config ['max_fit_range'].to_numpy()
+        cbi = np.where ( cbi < 0 , 15000 , cbi )
 
         lower_cbs = np.nanmin ( cbi , axis = 1 )
 
-        result = np.all ( lower_cbs >= (  config [ 'min_fit_range' ]  + config [ 'min_fit_length' ] ).to_numpy ( ) )
+        result = np.all ( lower_cbs >= min_fit_top )
 
-        lower_cbs [ np.where ( lower_cbs >= max_fit_range ) ] = max_fit_range
+        lower_cbs = np.minimum ( lower_cbs , max_fit_range )
 
         max_available_fit_range = np.min ( lower_cbs )
 
@@ -161,7 +98,7 @@ def running_variance ( check ,  rcs_0 , rng , dt , config , max_available_fit_ra
         range array for rcs_0
     dt : array of datetimes
         time array for current time window
-    config : class attribute
+    config : named tuple
         contains settings and thresholds
     max_available_fit_range : float
         maximum altitude at which all tests so far have been passed
@@ -177,54 +114,74 @@ def running_variance ( check ,  rcs_0 , rng , dt , config , max_available_fit_ra
         
     See also
     --------
-    overlap_probe_eprofile.pre_checks.enough_clear_range_cbi
+    overlap_probe_eprofile.find_fitting_windows.enough_clear_range_cbi
     
     
     """
 
     if check:
 
-        min_r = np.where ( rng <= config [ 'min_range_std_over_mean' ].to_numpy ( ) ) [ 0 ] [ -1 ]
+        min_range_std_over_mean = config.min_range_std_over_mean
+
+        min_fit_top = config.min_fit_range + config.min_fit_length
+
+        min_r = np.searchsorted ( rng , min_range_std_over_mean , side = 'right' ) - 1
+
+        max_r = np.searchsorted ( rng , max_available_fit_range , side = 'right' ) - 1
 
-        max_r = np.where ( rng <= max_available_fit_range ) [ 0 ] [ -1 ]
+        dt_sliding_variance=  int ( config.dt_sliding_variance )
 
-        dt_sliding_variance=  int ( config [ 'dt_sliding_variance' ].iloc [ 0 ] )
+        max_std_over_mean = config.max_std_over_mean
 
-        max_std_over_mean = config [ 'max_std_over_mean' ].to_numpy()
+        t = np.asarray ( dt , dtype = 'datetime64[ns]' )
 
-        variance_times = dt + datetime.timedelta ( minutes = dt_sliding_variance )
+        sliding_variance = np.timedelta64 ( dt_sliding_variance , 'm' )
 
-        start_inds = [ *range ( 0 , len ( dt ) ) ]
+        start_inds = np.flatnonzero ( t <= ( t [ -1 ] - sliding_variance ) )
 
-        end_inds = [ np.where ( np.asarray ( dt ) <= f ) [ 0 ] [ -1 ] for f in variance_times ]
+        # last profile at or before each window end, found on the running minimum 
+        # from the end so that it also holds where filled gaps put times out of order
 
-        std_over_mean = np.zeros ( max_r - min_r )
+        end_inds = np.searchsorted ( np.minimum.accumulate ( t [ : : -1 ] ) [ : : -1 ] , t [ start_inds ] + sliding_variance , side = 'right' ) - 1
 
-        signal1 = np.abs ( rcs_0 [  :  , min_r : max_r  ] )
+        log_signal = np.abs ( rcs_0 [  :  , min_r : max_r  ] )
 
-        for s , f in zip ( start_inds , end_inds ) :
+        with np.errstate ( divide = 'ignore' ) :
 
-            if dt [ s ] <= ( dt [ -1 ] -  datetime.timedelta ( minutes = dt_sliding_variance ) ) :
+            np.log10 ( log_signal , out = log_signal )
 
-                signal2 = np.abs ( rcs_0 [ s : f , min_r : max_r  ] )
+        # only the first bin over 'max_std_over_mean' is needed, so the bins are 
+        # worked through upwards in blocks and the search stops at the first hit
 
-                std_over_mean_tmp = np.nanstd ( np.emath.log10 ( signal2 ) , axis = 0 ) / np.nanmedian ( np.emath.log10 ( signal1 )  , axis = 0 )
+        block_size = 64
 
-                std_over_mean = np.maximum ( std_over_mean , std_over_mean_tmp )
+        if np.shape ( start_inds ) [ 0 ] > 0 :
 
-        i_first_over_thresh_std_over_mean = np.argwhere ( std_over_mean >= max_std_over_mean )
+            window_start , window_end = _window_index ( start_inds , end_inds )
 
-        if np.shape (i_first_over_thresh_std_over_mean ) [ 0 ] != 0:
+        for b in range ( 0 , np.shape ( log_signal ) [ 1 ] , block_size ) :
 
-                ind = i_first_over_thresh_std_over_mean [ 0 ] [ 0 ]
+            block = log_signal [ : , b : b + block_size ]
 
-                max_available_fit_range = rng [ min_r + ind  ]
+            std_over_mean = np.zeros ( np.shape ( block ) [ 1 ] )
 
-                return max_available_fit_range  >=  (config [ 'min_fit_range' ]  + config [ 'min_fit_length' ] ).to_numpy ( ) , max_available_fit_range , std_over_mean [ ind ] 
+            if np.shape ( start_inds ) [ 0 ] > 0 :
 
-        else :
+                std_over_mean_tmp = _sliding_nanstd ( block , window_start , window_end ) / np.nanmedian ( block , axis = 0 )
 
-            return max_available_fit_range >=  (config [ 'min_fit_range' ]  + config [ 'min_fit_length' ] ).to_numpy ( ) , max_available_fit_range , 0.0
+                std_over_mean = np.maximum ( std_over_mean , np.max ( std_over_mean_tmp , axis = 0 ) )
+
+            i_first_over_thresh_std_over_mean = np.flatnonzero ( std_over_mean >= max_std_over_mean )
+
+            if np.shape ( i_first_over_thresh_std_over_mean ) [ 0 ] != 0 :
+
+                ind = i_first_over_thresh_std_over_mean [ 0 ]
+
+                max_available_fit_range = rng [ min_r + b + ind  ]
+
+                return max_available_fit_range  >=  min_fit_top , max_available_fit_range , std_over_mean [ ind ] 
+
+        return max_available_fit_range >=  min_fit_top , max_available_fit_range , 0.0
 
     else :
 
@@ -234,6 +191,65 @@ def running_variance ( check ,  rcs_0 , rng , dt , config , max_available_fit_ra
 
 
 
+def _window_index ( start_inds , end_inds ) :
+
+    """Index arrays of the first profile and the end of each sliding window as
+    used by _sliding_nanstd. For evenly spaced profiles the windows are 
+    consecutive and all the same length, so they are returned as slices, 
+    which read the running sums as views rather than gathering with the 
+    index arrays.
+    """
+
+    widths = end_inds - start_inds
+
+    if np.all ( np.diff ( start_inds ) == 1 ) and np.all ( widths == widths [ 0 ] ) :
+
+        return slice ( start_inds [ 0 ] , start_inds [ -1 ] + 1 ) , slice ( end_inds [ 0 ] , end_inds [ -1 ] + 1 )
+
+    return start_inds , end_inds
+
+def _sliding_nanstd ( x , start_inds , end_inds ) :
+
+    """np.nanstd ( x [ s : f ] , axis = 0 ) for each pair of start and end indices,
+    found from running sums of x and x ** 2 down the columns so that each window 
+    costs a subtraction rather than a pass over its rows. The columns are centred
+    first to keep the sums small. As with np.nanstd, a window with no valid values
+    or containing an inf gives NaN. The indices are arrays or, from 
+    _window_index, slices.
+    """
+
+    finite = np.isfinite ( x )
+
+    n_valid = np.sum ( finite , axis = 0 )
+
+    shift = np.where ( finite , x , 0 ).sum ( axis = 0 ) / np.maximum ( n_valid , 1 )
+
+    y = np.where ( finite , x - shift , 0 )
+
+    zero = np.zeros ( ( 1 , np.shape ( x ) [ 1 ] ) )
+
+    cum_n = np.concatenate ( ( zero , np.cumsum ( finite , axis = 0 ) ) )
+
+    cum_inf = np.concatenate ( ( zero , np.cumsum ( np.isinf ( x ) , axis = 0 ) ) )
+
+    cum_x = np.concatenate ( ( zero , np.cumsum ( y , axis = 0 ) ) )
+
+    cum_x2 = np.concatenate ( ( zero , np.cumsum ( y ** 2 , axis = 0 ) ) )
+
+    n = cum_n [ end_inds ] - cum_n [ start_inds ]
+
+    with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
+
+        mean = ( cum_x [ end_inds ] - cum_x [ start_inds ] ) / n
+
+        var = ( cum_x2 [ end_inds ] - cum_x2 [ start_inds ] ) / n - mean ** 2
+
+    std = np.sqrt ( np.maximum ( var , 0 ) )
+
+    std [ ( n <= 0 ) | ( cum_inf [ end_inds ] - cum_inf [ start_inds ] > 0 ) ] = np.nan
+
+    return std
+
 def check_grads ( check ,  rcs_0 , rng , config , max_available_fit_range ) :
     
     """Checks described in section 3.1.2, 3.2 and 3.4 of the appendix of 
@@ -258,7 +274,7 @@ def check_grads ( check ,  rcs_0 , rng , config , max_available_fit_range ) :
         range array for rcs_0
     dt : array of datetimes
         time array for current time window
-    config : class attribute
+    config : named tuple
         contains settings and thresholds
     max_available_fit_range : float
         maximum altitude at which all tests so far have been passed
@@ -274,8 +290,8 @@ def check_grads ( check ,  rcs_0 , rng , config , max_available_fit_range ) :
         
     See also
     --------
-    overlap_probe_eprofile.pre_checks.running_variance test   
-    overlap_probe_eprofile.pre_checks.conv2
+    overlap_probe_eprofile.find_fitting_windows.running_variance
+    overlap_probe_eprofile.overlap_utils.conv2d
     
     """
 
@@ -285,61 +301,97 @@ def check_grads ( check ,  rcs_0 , rng , config , max_available_fit_range ) :
 
         m1 = m2 = m3 = max_available_fit_range 
 
-        min_r = np.where ( rng >= config [ 'min_range_std_over_mean' ].to_numpy ( ) ) [ 0 ] [ 0 ]
+        min_range_std_over_mean = config.min_range_std_over_mean
 
-        max_r = np.where ( rng <= max_available_fit_range ) [ 0 ] [ -1 ] 
+        first_range_gradY = config.first_range_gradY
+
+        max_relgrad = config.max_relgrad
+
+        max_relgrad_mean = config.max_relgrad_mean
+
+        min_fit_top = config.min_fit_range + config.min_fit_length
+
+        min_r = np.searchsorted ( rng , min_range_std_over_mean , side = 'left' )
+
+        max_r = np.searchsorted ( rng , max_available_fit_range , side = 'right' ) - 1 
 
         rconv = rng [ min_r + 1 : max_r - 1 ]
 
-        lRCS = np.log10 ( abs ( rcs_0 [ : , min_r : max_r ] ) )
+        i_first_range_gradY = np.searchsorted ( rconv , first_range_gradY , side = 'left' )
+
+        i_min_range_std_over_mean = np.searchsorted ( rconv , min_range_std_over_mean , side = 'left' )
+
+        irgradmagn = np.arange ( i_first_range_gradY , np.searchsorted ( rconv , max_available_fit_range , side = 'right' ) )
+
+        with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
+
+            lRCS = abs ( rcs_0 [ : , min_r : max_r ] )
+
+            np.log10 ( lRCS , out = lRCS )
+
+            gradY = conv2d ( lRCS , direction =  'y' ) [ 1 : -1 , 1 : -1 ]
+
+            gradX = conv2d ( lRCS, direction = 'x' ) [ 1 : -1 , 1 : -1 ]
+
+            abs_lRCS = np.abs ( lRCS , out = lRCS ) [ 1 : -1 , 1 : -1 ]
+
+            relgradmagn_sub = gradX * gradX
+
+            relgradmagn_sub += gradY * gradY
+
+            np.sqrt ( relgradmagn_sub , out = relgradmagn_sub )
+
+            relgradmagn_sub /= abs_lRCS
+
+            relgradYmax = np.max ( np.divide ( np.abs ( gradY , out = gradY ) , abs_lRCS , out = gradY ) , axis = 0  )
 
-        gradY = conv2d ( lRCS , direction =  'y' )
+            relgradXmax = np.max ( np.divide ( np.abs ( gradX , out = gradX ) , abs_lRCS , out = gradX ) , axis = 0  )
 
-        gradX = conv2d ( lRCS, direction = 'x' )
+            over_thresh_relgradY = relgradYmax [ i_first_range_gradY : ] >= max_relgrad
 
-        relgradY = abs ( gradY ) / abs (lRCS)
+            over_thresh_relgradX = relgradXmax [ i_min_range_std_over_mean : ] >= max_relgrad
 
-        relgradX = abs ( gradX ) / abs (lRCS)
+        if np.count_nonzero ( over_thresh_relgradY ) > 1 :
 
-        relgradmagn = np.sqrt ( gradX  ** 2 + gradY  ** 2 ) / abs ( lRCS )
+            i_first_over_thresh_relgradY = np.argmax ( over_thresh_relgradY )
 
-        relgradYmax = np.max ( relgradY [ 1 : -1 , 1 : -1] , axis = 0  )
+            Y = relgradYmax [ i_first_over_thresh_relgradY ]
 
-        relgradXmax = np.max ( relgradX [ 1 : -1 , 1 : -1 ] , axis = 0  )
+            m1 = rconv [ 10 + i_first_over_thresh_relgradY ]
 
-        relgradmagn_sub = relgradmagn [ 1 : -1 , 1 : -1 ]
+        if np.count_nonzero ( over_thresh_relgradX ) > 1 :
 
-        irgradmagn  = np.where ( ( rconv >= config [ 'first_range_gradY' ].to_numpy ( ) ) * ( rconv <= max_available_fit_range ) ) [ 0 ]
+            i_first_over_thresh_relgradX = np.argmax ( over_thresh_relgradX )
 
-        i_first_over_thresh_relgradY = np.where ( relgradYmax [ np.where ( rconv >= config [ 'first_range_gradY' ].to_numpy ( ) ) ] >= config [ 'max_relgrad' ].to_numpy ( ) )
+            X = relgradXmax [ i_first_over_thresh_relgradX ]
 
-        i_first_over_thresh_relgradX = np.where ( relgradXmax [ np.where ( rconv >= config [ 'min_range_std_over_mean' ].to_numpy ( ) ) ] >= config [ 'max_relgrad' ].to_numpy ( ) )
+            m2 = rconv [ i_first_over_thresh_relgradX ]
 
-        if np.shape( i_first_over_thresh_relgradY ) [ 1 ] > 1 :
+        if np.shape ( irgradmagn ) [ 0 ] > 2 :
 
-            Y = relgradYmax [ i_first_over_thresh_relgradY [ 0 ] [ 0 ] ]
+            chunk = relgradmagn_sub [ : , irgradmagn [ 0 ] : irgradmagn [ -1 ] ]
 
-            m1 = rconv [ 10 + i_first_over_thresh_relgradY [ 0 ] [ 0 ] ]
+            valid = ~ np.isnan ( chunk )
 
-        if np.shape( i_first_over_thresh_relgradX ) [ 1 ]  > 1 :
+            chunk_max = np.fmax.accumulate ( np.fmax.reduce ( chunk , axis = 0 ) )
 
-            X = relgradXmax [ i_first_over_thresh_relgradX [ 0 ] [ 0 ] ]
+            with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
 
-            m2 = rconv [ i_first_over_thresh_relgradX [ 0 ] [ 0 ] ]
+                chunk_mean = np.cumsum ( np.where ( valid , chunk , 0 ).sum ( axis = 0 ) ) / np.cumsum ( valid.sum ( axis = 0 ) )
 
-        for k in range ( np.shape(irgradmagn)[0]-1 , 1 , -1 ) :
+            k = np.arange ( 2 , np.shape ( irgradmagn ) [ 0 ] )
 
-            chunk = ( relgradmagn_sub [ : , irgradmagn [ 0 ] : irgradmagn [ k ] ] )
+            i_end = irgradmagn [ k ] - irgradmagn [ 0 ] - 1
 
-            if ( np.nanmax(chunk)  <= config [ 'max_relgrad' ].to_numpy( ) ) and (np.nanmean(chunk ) <= config [ 'max_relgrad_mean' ].to_numpy( ) ) :
+            passed = np.flatnonzero ( ( chunk_max [ i_end ] <= max_relgrad ) & ( chunk_mean [ i_end ] <= max_relgrad_mean ) )
 
-                m3 = rconv [ irgradmagn [ k ] -1 ]
+            if passed.size > 0 :
 
-                break
+                m3 = rconv [ irgradmagn [ k [ passed [ -1 ] ] ] -1 ]
 
         max_available_fit_range = np.min ( [ max_available_fit_range , m1 , m2 , m3 ] )
 
-        return max_available_fit_range >=  (config [ 'min_fit_range' ]  + config [ 'min_fit_length' ] ).to_numpy ( ) , max_available_fit_range , X , Y , m1 , m2 , m3 
+        return max_available_fit_range >=  min_fit_top , max_available_fit_range , X , Y , m1 , m2 , m3 
 
     else :
 
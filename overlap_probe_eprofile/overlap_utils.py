@@ -8,15 +8,118 @@ Utility functions called in by other modules
 
 import numpy as np
 import pandas as pd
-import scipy.signal as ss
+from scipy.ndimage import convolve1d
 import netCDF4 as nc
 import os
 import datetime
-import matplotlib
-#matplotlib.use('agg')
-import matplotlib.pyplot as plt
-from matplotlib import gridspec
-from matplotlib import colors
+import functools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+_SOBEL_SMOOTH = np.array ( [ 1.0 , 2.0 , 1.0 ] )
+
+_SOBEL_DIFF = np.array ( [ 1.0 , 0.0 , -1.0 ] )
+
+@functools.lru_cache ( maxsize = None )
+def _config_tuple_type ( fields ) :
+    
+    return namedtuple ( 'Config' , fields )
+
+def config_to_namedtuple ( config ) :
+    
+    """Converts the Pandas dataframe of settings and thresholds made by 
+    overlap_probe_eprofile.process_L1.Eprofile_Reader.get_constants into a 
+    named tuple of scalars, so that values can be read as attributes 
+    ( e.g. config.min_fit_range ) rather than with a dataframe lookup 
+    each time they are needed.
+    
+    Parameters
+    ----------
+    
+    config : pandas data frame
+        thresholds and settings, one column per setting
+    
+    Returns
+    -------
+    config : named tuple
+        the same thresholds and settings as scalars
+        
+    See also
+    --------
+    overlap_probe_eprofile.process_L1.Eprofile_Reader.get_constants
+    
+    """
+    
+    Config = _config_tuple_type ( tuple ( config.columns ) )
+    
+    return Config ( *[ config [ c ].values [ 0 ] for c in config.columns ] )
+
+@functools.lru_cache ( maxsize = None )
+def _parse_config_file ( path , mtime ) :
+    
+    config_df = pd.read_csv ( path , sep = ',', skiprows = 1 , header = None )
+
+    config_df = config_df.transpose ( )
+
+    config_df.columns = config_df.iloc [ 0 ]
+
+    return config_df.drop ( config_df.index [ 0 ] )
+
+@functools.lru_cache ( maxsize = None )
+def _parse_overlap_file ( path , mtime ) :
+    
+    return np.asarray ( pd.read_csv ( path , sep = '\t' , skiprows = 1 , header = None , nrows = 1 ) ) [ 0 ]
+
+def read_config_file ( config ) :
+    
+    """Reads a text file of settings and thresholds into a one row Pandas 
+    dataframe, one column per setting. The parsed file is cached on its path 
+    and modification time, so that processing many L1 files with the same 
+    config file only reads it once. A copy is returned each time as callers 
+    add their own columns.
+    
+    Parameters
+    ----------
+    
+    config : string 
+        path to text file containing settings and thresholds
+    
+    Returns
+    -------
+    config_df : pandas data frame
+        thresholds and settings, one column per setting
+        
+    See also
+    --------
+    overlap_probe_eprofile.process_L1.Eprofile_Reader.get_constants
+    
+    """
+    
+    config = os.path.abspath ( config )
+    
+    return _parse_config_file ( config , os.path.getmtime ( config ) ).copy ( )
+
+def read_overlap_file ( ov ) :
+    
+    """Reads a reference overlap function from a text file, cached in the 
+    same way as read_config_file.
+    
+    Parameters
+    ----------
+    
+    ov : string 
+        path to text file containing the overlap function
+    
+    Returns
+    -------
+    ov : array
+        the overlap function
+        
+    """
+    
+    ov = os.path.abspath ( ov )
+    
+    return _parse_overlap_file ( ov , os.path.getmtime ( ov ) ).copy ( )
 
 def conv2d ( x , direction = None ) :
 
@@ -25,6 +128,10 @@ def conv2d ( x , direction = None ) :
     slightly differently. This function reproduces the behaviour of the Matlab 
     function. Used in 'check_grads' to match the Matlab code results.
     
+    The Sobel operator is separable, so the 2D convolution is done as a 
+    smoothing pass along one axis followed by a difference pass along the 
+    other, with zero padding at the edges as in conv2 ( ... , 'same' ).
+    
     Parameters
     ----------
     
@@ -47,20 +154,22 @@ def conv2d ( x , direction = None ) :
     
     if direction == 'y' :
         
-        grad = np.asarray ( [ 1 , 0 , -1 , 2 , 0 , -2 , 1 , 0 , -1 ] ).reshape ( ( 3 , 3 ) )
+        weights_0 , weights_1 = _SOBEL_SMOOTH , _SOBEL_DIFF
         
     elif direction == 'x' :
 
-        grad = np.asarray ( [ 1 , 2 , 1 , 0 , 0 , 0 , -1 , -2 , -1 ] ).reshape ( ( 3 , 3 ) )
+        weights_0 , weights_1 = _SOBEL_DIFF , _SOBEL_SMOOTH
 
-    return np.rot90 ( ss.convolve2d ( np.rot90 ( x , 2 ) , np.rot90 ( grad , 2 ) , mode = 'same' ) , 2 )
+    return convolve1d ( convolve1d ( x , weights_0 , axis = 0 , mode = 'constant' ) , weights_1 , axis = 1 , mode = 'constant' )
 
 def simple_linear_fit ( n , x , y ) :
     
     """
     
     Calculates the intercepts (alphas) and slopes (betas) of a simple linear fit 
-    to the unmasked values in each column of masked array y. 
+    to the unmasked values in each column of masked array y. Masked and 
+    non-finite values are zeroed and the sums taken over plain arrays, columns 
+    with no valid ( x , y ) pairs are masked in the results.
         
     Parameters
     ----------
@@ -82,17 +191,51 @@ def simple_linear_fit ( n , x , y ) :
         
     """
 
-    x = np.ma.masked_invalid ( x ) 
+    x_valid = ~ np.ma.getmaskarray ( x ) & np.isfinite ( np.ma.getdata ( x ) )
+    
+    y_valid = ~ np.ma.getmaskarray ( y ) & np.isfinite ( np.ma.getdata ( y ) )
+    
+    x = np.where ( x_valid , np.ma.getdata ( x ) , 0 )
+    
+    y = np.where ( y_valid , np.ma.getdata ( y ) , 0 )
     
-    y = np.ma.masked_invalid ( y )
+    sum_x = np.sum ( x , axis = 0 )
        
-    beta = (   n * np.ma.sum ( ( x * y ) , axis = 0 ) - np.ma.sum ( x , axis = 0 ) * np.ma.sum ( y , axis = 0 ) ) / ( n * np.ma.sum (  ( x * x ) , axis = 0 ) - ( np.ma.sum ( x , axis = 0  ) * np.ma.sum ( x, axis = 0  ) ) )
+    beta = (   n * np.sum ( ( x * y ) , axis = 0 ) - sum_x * np.sum ( y , axis = 0 ) ) / ( n * np.sum (  ( x * x ) , axis = 0 ) - ( sum_x * sum_x ) )
+    
+    alpha = ( ( 1 / n ) * np.sum ( y , axis = 0 ) ) - ( ( 1 / n ) * beta * sum_x )
+    
+    no_valid_pairs = ~ np.any ( x_valid & y_valid , axis = 0 )
+    
+    return  np.ma.masked_array ( alpha , mask = no_valid_pairs ) , np.ma.masked_array ( beta , mask = no_valid_pairs )
+
+def _map_last_axis_chunks ( func , x , n_jobs ) :
+    
+    """Applies func to x split into n_jobs chunks along its last axis using a 
+    pool of threads and joins the results back together. Only valid for 
+    functions that treat each layer of the last axis independently. n_jobs = -1 
+    uses one thread per CPU.
+    """
+    
+    if n_jobs is None or n_jobs < 0 :
+        
+        n_jobs = os.cpu_count ( ) or 1
     
-    alpha = ( ( 1 / n ) * np.ma.sum ( y , axis = 0 ) ) - ( ( 1 / n ) * beta * np.ma.sum ( x , axis = 0 ) )
+    n_jobs = min ( n_jobs , np.shape ( x ) [ -1 ] )
     
-    return  alpha , beta
+    if n_jobs <= 1 :
+        
+        return func ( x )
+    
+    chunks = np.array_split ( np.arange ( np.shape ( x ) [ -1 ] ) , n_jobs )
+    
+    with ThreadPoolExecutor ( max_workers = n_jobs ) as executor :
+        
+        results = list ( executor.map ( lambda c : func ( x [ ... , c [ 0 ] : c [ -1 ] + 1 ] ) , chunks ) )
+    
+    return np.concatenate ( results , axis = -1 )
 
-def conv3d ( x , direction = None ) :
+def conv3d ( x , direction = None , n_jobs = 1 ) :
 
     """Finds the signal gradient along a stated direction for each layer of a 3D 
     array using convolution with a Sobel operator. Matlab's convolve and Python's 
@@ -100,6 +243,9 @@ def conv3d ( x , direction = None ) :
     the behaviour of the Matlab function. Called by 'check_temporal_spatial_homogeneity' 
     to match the Matlab code results.
     
+    As in conv2d the Sobel operator is applied as two 1D passes, here along the 
+    first two axes only, so each layer is handled on its own.
+    
     Parameters
     ----------
     
@@ -107,6 +253,8 @@ def conv3d ( x , direction = None ) :
         input signal 
     direction : str
         direction in which grdient is to be calculated. 'x' or 'y'
+    n_jobs : int
+        number of threads the layers are shared between, -1 for one per CPU
     
     Returns
     -------
@@ -122,25 +270,64 @@ def conv3d ( x , direction = None ) :
 
     if direction == 'x' :
         
-        grad = np.asarray ( [ 1 , 0 , -1 , 2 , 0 , -2 , 1 , 0 , -1 ] ).reshape ( ( 3 , 3 ) )
+        weights_0 , weights_1 = _SOBEL_SMOOTH , _SOBEL_DIFF
         
     elif direction == 'y' :
 
-        grad = np.asarray ( [ 1 , 2 , 1 , 0 , 0 , 0 , -1 , -2 , -1 ] ).reshape ( ( 3 , 3 ) )
+        weights_0 , weights_1 = _SOBEL_DIFF , _SOBEL_SMOOTH
+
+    return _map_last_axis_chunks ( lambda c : convolve1d ( convolve1d ( c , weights_0 , axis = 0 , mode = 'constant' ) , weights_1 , axis = 1 , mode = 'constant' ) , x , n_jobs )
 
-    return np.rot90 ( ss.convolve ( np.rot90 ( x , 2 ) , np.rot90 ( grad [ :, : , None ] , 2 ) , mode = 'same' ) , 2 )
+def relative_gradient_magnitude ( x , n_jobs = 1 ) :
 
-def quantile ( x , q ) :
+    """Finds the magnitude of the signal gradient relative to the signal for 
+    each layer of a 3D array, i.e. sqrt ( gradX ** 2 + gradY ** 2 ) / abs ( x ) 
+    with gradX and gradY from conv3d. Both gradients and the magnitude are 
+    worked out one chunk of layers at a time, so the intermediate gradient 
+    arrays never cover the whole input.
+    
+    Parameters
+    ----------
+    
+    x : 3D array of floats
+        input signal 
+    n_jobs : int
+        number of threads the layers are shared between, -1 for one per CPU
+    
+    Returns
+    -------
+    relgradmagn : 3D array of floats
+        magnitude of the relative gradient of the input signal
+        
+    See also
+    --------
+    overlap_probe_eprofile.overlap_utils.conv3d
     
-    n = len(x)
+    """
     
-    y = np.sort(x)
+    def magnitude ( c ) :
+        
+        gradY = conv3d ( c , direction = 'y' )
+        
+        gradX = conv3d ( c , direction = 'x' )
+        
+        with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
+        
+            gradX *= gradX
+            
+            gradX += gradY * gradY
+            
+            return np.sqrt ( gradX ) / abs ( c )
     
-    return ( np.interp ( q , np.linspace ( 1 / ( 2 * n ) , ( 2 * n - 1 ) / ( 2 * n ), n ), y ) )
+    return _map_last_axis_chunks ( magnitude , x , n_jobs )
 
-def prctile ( x , p ) :
+def quantile ( x , q , axis = None ) :
+    
+    return np.nanquantile ( x , q , axis = axis , method = 'hazen' )
+
+def prctile ( x , p , axis = None ) :
       
-    return ( quantile ( x ,  p  / 100 ) )  
+    return ( quantile ( x ,  np.asarray ( p ) / 100 , axis = axis ) )  
 
 def create_results_df ( rng , p , poly , resid , resid_whole_zone , ov , ovp_fc , val_max , relgrad_max , relgrad_mean , val_min_slope , index_min_slope , top_mask , bottom_mask , internal_temperature , conditionals , config ) :
    
@@ -165,7 +352,7 @@ def create_results_df ( rng , p , poly , resid , resid_whole_zone , ov , ovp_fc
     bottom_mask :
     internal_temperature :
     conditionals :
-    config :
+    config : named tuple
     
     Returns
     -------
@@ -179,98 +366,59 @@ def create_results_df ( rng , p , poly , resid , resid_whole_zone , ov , ovp_fc
        
 
     """
-    columns = ['rng_start' ,
-               'rng_end' ,
-               'fit_length' ,
-               'slope' ,
-               'slope_limits',
-               'intercept' ,
-               'intercept_limits' ,
-               'residual',
-               'residual_threshold',
-               'residual_whole_zone' ,
-               'resid_whole_zon_thresh',
-               'max_ov' ,
-               'max_ov_thresh',
-               'overlap_relative_error' ,
-               'ov_rel_err_thresh' ,
-               'rel_grad_mag_max',
-               'rel_grad_max_thresh',
-               'rel_grad_mag_mean',
-               'rel_grad_mean_thresh',
-               'val_min_slope',
-               'val_min_slope_thresh',
-               'index_min_slope',
-               'index_min_slope_max',
-               'pass_all',
-               'internal_temperature' ]
-            
-    results_for_this_interval = pd.DataFrame ( data = np.zeros ( ( np.shape ( top_mask ) [ 1 ] , len(columns) ) ) , columns = columns )
+    filled_ovp_fc = np.ma.filled ( ovp_fc.T , np.nan )
     
-    corrected_overlap = pd.DataFrame ( data = ovp_fc.T )
+    corrected_overlap = pd.DataFrame ( data = filled_ovp_fc , copy = False )
     
-    deep_rng = np.repeat ( rng [ : , np.newaxis ], np.shape ( top_mask ) [ 1 ] , axis = 1 )
+    n_windows = np.shape ( top_mask ) [ 1 ]
     
     index_begin = np.argmin ( bottom_mask , axis = 0 )
     
     index_stop = np.argmax ( top_mask , axis = 0 )
     
-    fit_begin = deep_rng [ index_begin -1 , np.arange ( 0 , np.shape ( top_mask ) [ 1 ] ) ]
+    fit_begin = rng [ index_begin -1 ]
     
-    fit_stop = deep_rng [ index_stop -1 , np.arange ( 0 , np.shape ( top_mask ) [ 1 ] ) ]
+    fit_stop = rng [ index_stop -1 ]
     
     fit_length = fit_stop - fit_begin
     
-    results_for_this_interval ['rng_start' ] = fit_begin
-    
-    results_for_this_interval [ 'rng_end'  ] = fit_stop
-    
-    results_for_this_interval [ 'fit_length' ] = fit_length
-    
-    results_for_this_interval [ 'slope' ] = p [ 1 ]
-    
-    results_for_this_interval ['slope_limits'] = str ( config [ 'min_expected_slope' ].values [ 0 ] )  + ' <= slope <= ' + str  ( config [ 'max_expected_slope' ].values [ 0 ] )  
-    
-    results_for_this_interval [ 'intercept' ] = p [ 0 ]
-    
-    results_for_this_interval [ 'intercept_limits'] = str ( config [ 'min_expected_zero_fit_value' ].values [ 0 ] )  + ' <= intercept >= ' + str  ( config [ 'max_expected_zero_fit_value' ].values [ 0 ] ) 
-    
-    results_for_this_interval [ 'residual' ] = resid
-    
-    results_for_this_interval [ 'residual_thresh'] =  config [ 'thresh_resid_rel' ].values [ 0 ] * np.ma.mean ( poly , axis = 0) 
-    
-    results_for_this_interval [ 'residual_whole_zone' ] = resid_whole_zone
-    
-    results_for_this_interval [ 'residual_whole_zone_thresh'] =config [ 'thresh_resid_whole_zone' ].values [ 0 ]
-    
-    results_for_this_interval [ 'max_ov' ] = np.nanmax ( ovp_fc , axis = 0 )
-    
-    results_for_this_interval [ 'max_ov_thresh' ] = config [ 'max_overlap_value' ].values [ 0 ]  * np.nanmax ( ov )
-    
-    results_for_this_interval [ 'overlap_relative_error' ] = val_max 
-    
-    results_for_this_interval [ 'ov_rel_err_thresh' ] = config [ 'thresh_overlap_valid_rel_error' ].values [ 0 ]
-    
-    results_for_this_interval [ 'rel_grad_mag_max' ] = relgrad_max 
-    
-    results_for_this_interval [ 'rel_grad_max_thresh' ] = config [ 'max_relgrad' ].values [ 0 ]
-    
-    results_for_this_interval [ 'rel_grad_mag_mean' ] = relgrad_mean
-    
-    results_for_this_interval [ 'rel_grad_mean_thresh' ] =  config [ 'max_relgrad_mean' ].values [ 0 ]
-    
-    results_for_this_interval [ 'val_min_slope' ] = val_min_slope
-    
-    results_for_this_interval [ 'val_min_slope_thresh' ] = config [ 'min_slope' ].values [ 0 ]
-    
-    results_for_this_interval [ 'index_min_slope' ] =  index_min_slope
-    
-    results_for_this_interval [ 'index_min_slope_max'] = np.argmax ( top_mask , axis = 0 ) - 1
-    
-    results_for_this_interval [ 'pass_all'] = conditionals
-    
-    results_for_this_interval [ 'internal_temperature'] = np.nanmean ( internal_temperature )
+    with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
+    
+        poly_mean = np.sum ( np.ma.filled ( poly , 0 ) , axis = 0 ) / np.count_nonzero ( ~ np.ma.getmaskarray ( poly ) , axis = 0 )
+    
+    results = { 'rng_start' : fit_begin ,
+                'rng_end' : fit_stop ,
+                'fit_length' : fit_length ,
+                'slope' : p [ 1 ] ,
+                'slope_limits' : str ( config.min_expected_slope )  + ' <= slope <= ' + str  ( config.max_expected_slope ) ,
+                'intercept' : p [ 0 ] ,
+                'intercept_limits' : str ( config.min_expected_zero_fit_value )  + ' <= intercept >= ' + str  ( config.max_expected_zero_fit_value ) ,
+                'residual' : resid ,
+                'residual_threshold' : np.nan ,
+                'residual_whole_zone' : resid_whole_zone ,
+                'resid_whole_zon_thresh' : np.nan ,
+                'max_ov' : np.nanmax ( filled_ovp_fc , axis = -1 ) ,
+                'max_ov_thresh' : config.max_overlap_value  * np.nanmax ( ov ) ,
+                'overlap_relative_error' : val_max ,
+                'ov_rel_err_thresh' : config.thresh_overlap_valid_rel_error ,
+                'rel_grad_mag_max' : relgrad_max ,
+                'rel_grad_max_thresh' : config.max_relgrad ,
+                'rel_grad_mag_mean' : relgrad_mean ,
+                'rel_grad_mean_thresh' : config.max_relgrad_mean ,
+                'val_min_slope' : val_min_slope ,
+                'val_min_slope_thresh' : config.min_slope ,
+                'index_min_slope' : index_min_slope ,
+                'index_min_slope_max' : index_stop - 1 ,
+                'pass_all' : conditionals ,
+                'internal_temperature' : np.nanmean ( internal_temperature ) ,
+                'residual_thresh' : config.thresh_resid_rel * poly_mean ,
+                'residual_whole_zone_thresh' : config.thresh_resid_whole_zone }
+    
+    results_for_this_interval = pd.DataFrame ( results , index = pd.RangeIndex ( n_windows ) )
        
+    # the corrected overlap columns keep their integer labels ( range bin 
+    # index ), which is how final_selection picks them out
+
     results_for_this_interval = pd.concat ( [ results_for_this_interval , corrected_overlap ] , axis = 1 , ignore_index=False )
     
     return results_for_this_interval  
@@ -359,36 +507,51 @@ def write_temp_model_to_netcdf ( path_for_results , obj ) :
 
 
 
-def create_ceilo_plot ( L1 , vdr = None , mass = None , instrument = None , savepath = None , location = None ) :
-
-    RVal = [255, 212, 209, 207, 205, 202, 199, 196, 193, 189, 186, 183, 179, 176, 172, 169, 166, 163, 159, 156, 153, 149, 146, 143, 139, 136, 132, 128, 124, 121, 117, 113, 109, 105, 102,  98,  93,  89,  85,  81,  77,  73,  70,  66,  61,  57,  53,
-            49,  45,  41,  38,  34,  30,  26,  22,  19,  16,  13,  11,   9,   7,   5,   3,   2,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,
-            0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   1,   1,   1,   1,   1,   1,   1,   1,   0,   0,   0,   0,   0,   0,   0,   0,   0,   2,   4,   7,  10,  14,  18,  23,  28,  34,  41,  48,  55,  63,  72,  80,  88,  95, 103, 112,
-            121, 129, 137, 145, 153, 161, 168, 176, 184, 192, 201, 208, 215, 221, 227, 232, 236, 240, 244, 246, 249, 251, 252, 253, 253, 253, 253, 253, 252, 252, 252, 252, 252, 252, 252, 252, 252, 252, 252, 252, 253, 253, 253, 253, 253, 253,
-            253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 252, 252, 252, 251, 251, 251, 252, 252, 252, 252, 252, 251, 251, 251, 250, 249, 248, 246, 244, 242, 240, 237, 234, 230, 226, 223, 219, 215, 212,
-            208, 204, 199, 195, 191, 188, 184, 180, 176, 172, 167, 163, 159, 155, 151, 147, 144, 141, 138, 136, 134, 132, 131, 130]
-
-    GVal = [255, 216, 212, 209, 206, 203, 200, 197, 194, 190, 187, 184, 180, 176, 173, 169, 166, 163, 159, 156, 153, 149, 146, 142, 139, 135, 132, 128, 124, 121, 117, 113, 110, 106, 102,  98,  94,  90,  86,  82,  78,  74,  70,  67,  62,  58,  54,
-            50,  46,  42,  39,  35,  31,  27,  23,  20,  18,  16,  15,  15,  15,  15,  16,  18,  21,  24,  28,  32,  37,  43,  48,  53,  58,  63,  68,  72,  78,  83,  88,  92,  97, 102, 107, 111, 116, 122, 127, 132, 136, 141, 145, 149, 153,
-            157, 161, 165, 168, 171, 175, 178, 181, 184, 187, 190, 193, 196, 200, 203, 206, 209, 212, 215, 218, 221, 225, 228, 231, 234, 236, 239, 241, 243, 244, 246, 247, 249, 250, 251, 252, 252, 252, 252, 252, 252, 252, 252, 253, 253, 253,
-            253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 252, 251, 249, 247, 245, 243, 241, 238, 235, 232, 229, 225, 221, 217, 213, 209, 205, 201, 196, 192, 188, 184, 180, 176, 172, 168, 164, 161, 156, 152, 148, 144, 141,
-            137, 133, 128, 124, 120, 116, 111, 107, 103,  99,  95,  91,  88,  84,  80,  76,  72,  68,  65,  60,  56,  53,  49,  45,  40,  36,  32,  27,  23,  20,  17,  14,  11,   8,   6,   4,   3,   2,   1,   0,   0,   0,   0,   0,   0,   0,
-            0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0]
+_CLOUDNET_RGB = np.asarray ( ( [255, 212, 209, 207, 205, 202, 199, 196, 193, 189, 186, 183, 179, 176, 172, 169, 166, 163, 159, 156, 153, 149, 146, 143, 139, 136, 132, 128, 124, 121, 117, 113, 109, 105, 102,  98,  93,  89,  85,  81,  77,  73,  70,  66,  61,  57,  53,
+                                49,  45,  41,  38,  34,  30,  26,  22,  19,  16,  13,  11,   9,   7,   5,   3,   2,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,
+                                0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   1,   1,   1,   1,   1,   1,   1,   1,   0,   0,   0,   0,   0,   0,   0,   0,   0,   2,   4,   7,  10,  14,  18,  23,  28,  34,  41,  48,  55,  63,  72,  80,  88,  95, 103, 112,
+                                121, 129, 137, 145, 153, 161, 168, 176, 184, 192, 201, 208, 215, 221, 227, 232, 236, 240, 244, 246, 249, 251, 252, 253, 253, 253, 253, 253, 252, 252, 252, 252, 252, 252, 252, 252, 252, 252, 252, 252, 253, 253, 253, 253, 253, 253,
+                                253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 252, 252, 252, 251, 251, 251, 252, 252, 252, 252, 252, 251, 251, 251, 250, 249, 248, 246, 244, 242, 240, 237, 234, 230, 226, 223, 219, 215, 212,
+                                208, 204, 199, 195, 191, 188, 184, 180, 176, 172, 167, 163, 159, 155, 151, 147, 144, 141, 138, 136, 134, 132, 131, 130] ,
+                               [255, 216, 212, 209, 206, 203, 200, 197, 194, 190, 187, 184, 180, 176, 173, 169, 166, 163, 159, 156, 153, 149, 146, 142, 139, 135, 132, 128, 124, 121, 117, 113, 110, 106, 102,  98,  94,  90,  86,  82,  78,  74,  70,  67,  62,  58,  54,
+                                50,  46,  42,  39,  35,  31,  27,  23,  20,  18,  16,  15,  15,  15,  15,  16,  18,  21,  24,  28,  32,  37,  43,  48,  53,  58,  63,  68,  72,  78,  83,  88,  92,  97, 102, 107, 111, 116, 122, 127, 132, 136, 141, 145, 149, 153,
+                                157, 161, 165, 168, 171, 175, 178, 181, 184, 187, 190, 193, 196, 200, 203, 206, 209, 212, 215, 218, 221, 225, 228, 231, 234, 236, 239, 241, 243, 244, 246, 247, 249, 250, 251, 252, 252, 252, 252, 252, 252, 252, 252, 253, 253, 253,
+                                253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 253, 252, 251, 249, 247, 245, 243, 241, 238, 235, 232, 229, 225, 221, 217, 213, 209, 205, 201, 196, 192, 188, 184, 180, 176, 172, 168, 164, 161, 156, 152, 148, 144, 141,
+                                137, 133, 128, 124, 120, 116, 111, 107, 103,  99,  95,  91,  88,  84,  80,  76,  72,  68,  65,  60,  56,  53,  49,  45,  40,  36,  32,  27,  23,  20,  17,  14,  11,   8,   6,   4,   3,   2,   1,   0,   0,   0,   0,   0,   0,   0,
+                                0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0] ,
+                               [255, 225, 226, 227, 228, 228, 229, 230, 231, 232, 233, 234, 235, 236, 237, 238, 239, 240, 241, 242, 243, 244, 245, 246, 248, 249, 249, 250, 251, 251, 251, 251, 251, 252, 252, 252, 251, 251, 251, 251, 251, 251, 251, 251, 251, 251, 251,
+                                251, 251, 252, 252, 252, 252, 251, 251, 251, 250, 250, 249, 248, 247, 245, 243, 241, 239, 236, 234, 231, 229, 226, 223, 220, 217, 214, 211, 208, 205, 202, 199, 196, 193, 191, 188, 185, 182, 179, 175, 172, 168, 164, 161, 157, 153,
+                                149, 145, 141, 137, 133, 128, 123, 118, 113, 108, 102,  97,  92,  86,  81,  76,  71,  66,  61,  56,  51,  46,  41,  36,  32,  28,  24,  20,  17,  14,  12,  10,   8,   6,   4,   3,   2,   2,   1,   1,   1,   1,   1,   1,   1,   1,
+                                0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   0,   0,   0,   0,   0,   0,
+                                0,   1,   1,   1,   1,   1,   1,   2,   2,   2,   2,   2,   2,   1,   1,   1,   1,   1,   1,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   1,   1,   2,   3,   5,   7,   9,  11,  13,  16,  19,  22,  26,  30,  33,  36,  40,
+                                44,  47,  52,  55,  59,  62,  66,  70,  74,  78,  83,  87,  91,  95,  99, 102, 105, 108, 111, 113, 115, 117, 118, 120] ) , dtype = np.uint8 ).T
+
+@functools.lru_cache ( maxsize = None )
+def _cloudnet_cmap ( ) :
+    
+    """Builds the Cloudnet colour map used by create_ceilo_plot once, from the 
+    RGB table in _CLOUDNET_RGB.
+    """
+    
+    from matplotlib import colors
+    
+    my_cmap = colors.ListedColormap ( _CLOUDNET_RGB / 255.0 , name = 'Cloudnet' )
 
-    BVal = [255, 225, 226, 227, 228, 228, 229, 230, 231, 232, 233, 234, 235, 236, 237, 238, 239, 240, 241, 242, 243, 244, 245, 246, 248, 249, 249, 250, 251, 251, 251, 251, 251, 252, 252, 252, 251, 251, 251, 251, 251, 251, 251, 251, 251, 251, 251,
-            251, 251, 252, 252, 252, 252, 251, 251, 251, 250, 250, 249, 248, 247, 245, 243, 241, 239, 236, 234, 231, 229, 226, 223, 220, 217, 214, 211, 208, 205, 202, 199, 196, 193, 191, 188, 185, 182, 179, 175, 172, 168, 164, 161, 157, 153,
-            149, 145, 141, 137, 133, 128, 123, 118, 113, 108, 102,  97,  92,  86,  81,  76,  71,  66,  61,  56,  51,  46,  41,  36,  32,  28,  24,  20,  17,  14,  12,  10,   8,   6,   4,   3,   2,   2,   1,   1,   1,   1,   1,   1,   1,   1,
-            0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   1,   0,   0,   0,   0,   0,   0,
-            0,   1,   1,   1,   1,   1,   1,   2,   2,   2,   2,   2,   2,   1,   1,   1,   1,   1,   1,   0,   0,   0,   0,   0,   0,   0,   0,   0,   0,   1,   1,   2,   3,   5,   7,   9,  11,  13,  16,  19,  22,  26,  30,  33,  36,  40,
-            44,  47,  52,  55,  59,  62,  66,  70,  74,  78,  83,  87,  91,  95,  99, 102, 105, 108, 111, 113, 115, 117, 118, 120]
+    my_cmap.set_bad('white')
+    
+    return my_cmap
 
-    colours = np.transpose ( np.asarray ( ( RVal , GVal , BVal ) ) )
+def create_ceilo_plot ( L1 , vdr = None , mass = None , instrument = None , savepath = None , location = None ) :
 
-    fctab= colours / 255.0
+    # matplotlib is only needed for plotting, so it is imported here rather 
+    # than every time the processing modules are loaded
 
-    my_cmap = colors.ListedColormap ( fctab , name = 'Cloudnet' , N = None )
+    import matplotlib
+    #matplotlib.use('agg')
+    import matplotlib.pyplot as plt
+    from matplotlib import gridspec
 
-    my_cmap.set_bad('white')
+    my_cmap = _cloudnet_cmap ( )
 
     params = {'legend.fontsize': 20,
               'figure.figsize': (15, 5),
@@ -412,13 +575,15 @@ def create_ceilo_plot ( L1 , vdr = None , mass = None , instrument = None , save
 
     range1 = L1.rng / 1000
 
-    elastic = np.log10(beta)
-
     Time = np.asarray(m_time)
 
-    if instrument.upper() == 'CL61':
+    with np.errstate ( divide = 'ignore' , invalid = 'ignore' ) :
+
+        elastic = np.log10(beta)
+
+        if instrument.upper() == 'CL61':
 
-        VDR = np.log10(vdr)
+            VDR = np.log10(vdr)
 
     fig = plt.figure(num=None, facecolor='w', edgecolor='k')
 
@@ -432,7 +597,7 @@ def create_ceilo_plot ( L1 , vdr = None , mass = None , instrument = None , save
 
     plt.suptitle ( location + ' ' + instrument.upper() + ' ' + date , x = 0.125, y = 0.92,fontsize = LABEL_SIZE, color = 'r', ha = 'left')
 
-    p1 = plt.imshow(np.flipud(np.transpose(elastic)), vmin = 4, vmax = 6, extent=[Time[0],Time[-1],range1[0],range1[-1]],cmap = my_cmap,interpolation='none', aspect = 'auto')
+    p1 = plt.imshow(elastic.T, origin = 'lower', vmin = 4, vmax = 6, extent=[Time[0],Time[-1],range1[0],range1[-1]],cmap = my_cmap,interpolation='none', aspect = 'auto')
 
     ax1.xaxis_date()
 
@@ -476,7 +641,7 @@ def create_ceilo_plot ( L1 , vdr = None , mass = None , instrument = None , save
 
         ax2 = plt.subplot(gs[1,0])
 
-        p2 = plt.imshow(np.flipud(np.transpose(VDR)), vmin = -2.5, vmax = 0 , extent=[Time[0],Time[-1],range1[0],range1[-1]],cmap = my_cmap,interpolation='none', aspect = 'auto')
+        p2 = plt.imshow(VDR.T, origin = 'lower', vmin = -2.5, vmax = 0 , extent=[Time[0],Time[-1],range1[0],range1[-1]],cmap = my_cmap,interpolation='none', aspect = 'auto')
 
         ax2.xaxis_date()
 
@@ -504,7 +669,7 @@ def create_ceilo_plot ( L1 , vdr = None , mass = None , instrument = None , save
 
         ax3 = plt.subplot(gs[2,0])
 
-        plt.imshow(np.flipud(np.transpose(mass)), extent=[Time[0],Time[-1],range1[0],range1[-1]],cmap = matplotlib.cm.get_cmap('Reds'),interpolation='none', aspect = 'auto')
+        plt.imshow(mass.T, origin = 'lower', extent=[Time[0],Time[-1],range1[0],range1[-1]],cmap = matplotlib.cm.get_cmap('Reds'),interpolation='none', aspect = 'auto')
 
         ax3.xaxis_date()
 
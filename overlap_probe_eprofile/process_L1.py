@@ -31,13 +31,37 @@ import numpy as np
 import netCDF4 as nc
 import datetime
 import pandas as pd
-from scipy import stats
-from scipy.interpolate import interpn
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import overlap_probe_eprofile.find_fitting_windows as ffw
 import overlap_probe_eprofile.find_candidate_functions as fcf
 import overlap_probe_eprofile.final_selection as fs
+from overlap_probe_eprofile.overlap_utils import config_to_namedtuple , read_config_file , read_overlap_file
+
+
+def _mode_int ( x ) :
+    
+    """Most common value of x after rounding to integers, the smallest one 
+    if there is a tie. Used for the time step and window width, which are 
+    whole numbers, so a bincount does the job of scipy.stats.mode.
+    """
+    
+    x = np.rint ( x ).astype ( 'int64' )
+    
+    x_min = x.min ( )
+    
+    return np.bincount ( x - x_min ).argmax ( ) + x_min
+
+
+# message for the first failed pre-check, keyed by its position in the checks 
+# list made by Eprofile_Reader._check_window and filled in by catch_errors
+
+_PRE_CHECK_MESSAGES = { 0 : 'contains no data' ,
+                        1 : 'at least one sci~=0' ,
+                        2 : 'lowest cloud base is {m0}m should be {min_fit_range}m' ,
+                        3 : 'failed variance check {variance} at {m1}m' ,
+                        4 : 'failed grad check: X = {X} at {m3} Y = {Y} at {m4} finaly {m2}m' }
 
 
 class Eprofile_Reader ( object ) :
@@ -55,31 +79,33 @@ class Eprofile_Reader ( object ) :
     def __init__( self , data_file  ):
         """Constructor method
         """
-        L_nc = nc.Dataset( data_file )
+        with nc.Dataset ( data_file ) as L_nc :
+
+            L_nc.set_auto_mask ( False )
 
-        self.raw_time =  np.asarray ( L_nc.variables [ 'time' ] [ : ] ) 
+            self.raw_time = L_nc.variables [ 'time' ] [ : ]
 
-        self.rng = np.asarray ( L_nc.variables [ 'range' ] [ : ] , dtype = 'float64')
+            self.rng = np.asarray ( L_nc.variables [ 'range' ] [ : ] , dtype = 'float64')
 
-        self.rcs_0 = np.asarray ( L_nc.variables [ 'rcs_0' ] [ : , : ] )
+            self.rcs_0 = np.asarray ( L_nc.variables [ 'rcs_0' ] [ : , : ] , dtype = 'float32' )
 
-        self.cbh = np.asarray ( L_nc.variables [ 'cloud_base_height' ] [ : , : ] )
+            self.cbh = L_nc.variables [ 'cloud_base_height' ] [ : , : ]
 
-        self.sci = np.asarray ( L_nc.variables [ 'sci' ] [ : ] )
+            self.sci = L_nc.variables [ 'sci' ] [ : ]
 
-        self.rng_res = np.asarray ( L_nc.variables [ 'range_resol' ] [ : ] )
+            self.rng_res = L_nc.variables [ 'range_resol' ] [ : ]
         
-        self.internal_temperature = np.asarray( L_nc.variables [ 'temp_int' ] [ : ] )
+            self.internal_temperature = L_nc.variables [ 'temp_int' ] [ : ]
         
-        self.opt_mod_number = getattr ( L_nc , 'optical_module_id' )
+            self.opt_mod_number = getattr ( L_nc , 'optical_module_id' )
         
-        self.site_location = getattr ( L_nc , 'site_location' )
+            self.site_location = getattr ( L_nc , 'site_location' )
         
-        self.wigos_station_id = getattr ( L_nc , 'wigos_station_id' )
+            self.wigos_station_id = getattr ( L_nc , 'wigos_station_id' )
         
-        self.instrument_id = getattr ( L_nc , 'instrument_id' ) 
+            self.instrument_id = getattr ( L_nc , 'instrument_id' ) 
 
-        self.instrument_serial_number = getattr ( L_nc , 'instrument_serial_number' ) 
+            self.instrument_serial_number = getattr ( L_nc , 'instrument_serial_number' ) 
         
         
         
@@ -88,8 +114,8 @@ class Eprofile_Reader ( object ) :
         """Reads in and sorts settings / threshold values. Further threshold
         values are computed from a combination of these values and data_file 
         dimentions. The default overlap function is also read in from a text file.
-        Currently saved as a Pandas dataframe, this will be changed
-        to a named tuple in future for easier access.
+        The settings are held in self.config as a named tuple, so that they
+        can be read as attributes ( e.g. self.config.min_fit_range ).
         
         Parameters
         ----------
@@ -106,23 +132,29 @@ class Eprofile_Reader ( object ) :
             overlap would probably need different values for these thresholds. 
         """
 
-        config_df = pd.read_csv ( config , sep = ',', skiprows = 1 , header = None )
-
-        config_df = config_df.transpose ( )
+        config_df = read_config_file ( config )
 
-        config_df.columns = config_df.iloc [ 0 ]
-
-        config_df = config_df.drop ( config_df.index [ 0 ] )
-
-        self.ov = np.asarray ( pd.read_csv ( ov , sep = '\t' , skiprows = 1 , header = None , nrows = 1 ) ) [ 0 ]
+        self.ov = read_overlap_file ( ov )
         
         self.check_ov_range_res_same_as_data ( )
 
         config_df [ 'd_fit_range' ] = np.rint ( self.rng_res )
 
-        config_df [ 'min_fit_range' ] = self.rng [ np.where ( self.ov > 0.6 ) [ 0 ] [ 0 ] ]
+        above_fit_threshold = self.ov > 0.6
+
+        if not above_fit_threshold.any ( ) :
+
+            raise ValueError ( 'reference overlap function in ' + str ( ov ) + ' never exceeds 0.6, so min_fit_range cannot be set' )
+
+        overlap_valid = self.ov >= 1
+
+        if not overlap_valid.any ( ) :
 
-        config_df [ 'min_overlap_valid' ] = self.rng [ np.where ( self.ov >= 1 ) [ 0 ] [ 0 ] ]
+            raise ValueError ( 'reference overlap function in ' + str ( ov ) + ' never reaches 1, so min_overlap_valid cannot be set' )
+
+        config_df [ 'min_fit_range' ] = self.rng [ np.argmax ( above_fit_threshold ) ]
+
+        config_df [ 'min_overlap_valid' ] = self.rng [ np.argmax ( overlap_valid ) ]
 
         config_df [ 'max_fit_length' ] = config_df [ 'max_fit_range' ] - config_df [ 'min_fit_range' ]
 
@@ -138,7 +170,7 @@ class Eprofile_Reader ( object ) :
 
         config_df [ 'min_slope' ] = -2.5*1e-4
 
-        self.config = config_df
+        self.config = config_to_namedtuple ( config_df )
         
 
 
@@ -148,18 +180,36 @@ class Eprofile_Reader ( object ) :
         function . If not the data is interpolated onto the grid of the reference 
         overlap function. This has the effect of smothing the data slightly if it 
         was originally on a finer grid. This matches the behaviour of the original 
-        Matlab code.
+        Matlab code. The time axis is unchanged, so each profile is interpolated 
+        linearly along range only, with zeros outside the data's range.
         """
         
         if len ( self.ov ) != len ( self.rng ) :
                    
             ov_native_rng = np.arange ( 0, 15344, 14.984999 )
             
-            t_mesh, r_mesh = np.meshgrid (  self.raw_time , ov_native_rng )
+            lower = np.clip ( np.searchsorted ( self.rng , ov_native_rng , side = 'right' ) - 1 , 0 , len ( self.rng ) - 2 )
+            
+            weight = ( ( ov_native_rng - self.rng [ lower ] ) / ( self.rng [ lower + 1 ] - self.rng [ lower ] ) ).astype ( 'float32' )
+            
+            outside = ( ov_native_rng < self.rng [ 0 ] ) | ( ov_native_rng > self.rng [ -1 ] )
+            
+            rcs_0 = np.empty ( ( np.shape ( self.rcs_0 ) [ 0 ] , len ( ov_native_rng ) ) , dtype = 'float32' )
+            
+            # profiles are done in blocks so the temporaries stay small next to 
+            # the two full size arrays
             
-            rcs_0 = interpn ( ( np.asarray ( self.raw_time ), np.asarray ( self.rng ) ) , self.rcs_0 , ( t_mesh , r_mesh ), bounds_error=False , fill_value = 0 ,  method = 'linear' )
+            block_size = 512
             
-            self.rcs_0 = np.transpose(rcs_0)
+            for b in range ( 0 , np.shape ( self.rcs_0 ) [ 0 ] , block_size ) :
+                
+                block = self.rcs_0 [ b : b + block_size ]
+                
+                rcs_0 [ b : b + block_size ] = np.take ( block , lower , axis = 1 ) * ( 1 - weight ) + np.take ( block , lower + 1 , axis = 1 ) * weight
+            
+            rcs_0 [ : , outside ] = 0
+            
+            self.rcs_0 = rcs_0
       
             self.rng = ov_native_rng 
 
@@ -189,11 +239,13 @@ class Eprofile_Reader ( object ) :
         objects
         """
        
-        self.dt_raw = [ datetime.datetime ( 1970 , 1 , 1 ) + datetime.timedelta ( t ) for t in self.raw_time ]
+        raw_time = np.asarray ( self.raw_time , dtype = 'float64' )
+
+        self.dt_raw = list ( pd.to_datetime ( raw_time , unit = 'D' ).to_pydatetime ( ) )
         
-        self.dt = np.asarray ( [ pd.to_datetime(t).round('1s') for t in self.dt_raw ]  )
+        self.time = np.rint ( raw_time * 86400.0 )
         
-        self.time = np.asarray ( [ t.timestamp() for t in self.dt ] ) 
+        self.dt = np.asarray ( pd.to_datetime ( self.time.astype ( 'int64' ) , unit = 's' ) , dtype = object )
         
 
     def fill_gaps ( self ) :
@@ -214,11 +266,11 @@ class Eprofile_Reader ( object ) :
 
         tdelta = np.ediff1d ( self.time )
 
-        mode_delta = stats.mode ( tdelta ) [ 0 ]
+        mode_delta = _mode_int ( tdelta )
 
         gaps  = np.rint ( ( tdelta  / mode_delta ) )
 
-        if len (np.where ( gaps > 1 )[0]) > 0 :
+        if ( gaps > 1 ).any ( ) :
 
             ind_list =  np.cumsum ( gaps , dtype = int )
 
@@ -226,27 +278,15 @@ class Eprofile_Reader ( object ) :
 
             self.time = self.make_fill_times ( self.time , gaps , mode_delta , ind_list )
 
-            rcs_0 = self.find_and_fill( self.rcs_0 , gaps , ind_list)
+            self.rcs_0 = self.find_and_fill ( self.rcs_0 , gaps , ind_list , fill_value = np.nan )
 
-            cbh = self.find_and_fill ( self.cbh , gaps , ind_list )
-
-            cbh [ self.missing_flag ] = -999
-
-            self.cbh = cbh
+            self.cbh = self.find_and_fill ( self.cbh , gaps , ind_list , fill_value = -999 )
 
             self.sci = self.find_and_fill ( self.sci , gaps , ind_list )
 
-            rcs_0 [ self.missing_flag , : ] = np.nan
-
-            self.rcs_0 = rcs_0
-
         else:
 
-            missing_flag = np.zeros ( np.shape ( self.rcs_0 ) [ 0 ] )
-
-            missing_flag [ : ] = False
-
-            self.missing_flag = missing_flag.astype ( bool )
+            self.missing_flag = np.zeros ( np.shape ( self.rcs_0 ) [ 0 ] , dtype = bool )
             
 
     def make_fill_times ( self , signal , gaps , mode_delta , ind_list ) :
@@ -277,36 +317,22 @@ class Eprofile_Reader ( object ) :
         
         
 
-        gap_inds = np.where ( gaps > 1 )
-
-        gap_len = gaps [ gap_inds ] - 1
-
-        sts = np.insert (signal , 0 , 0 ) [ gap_inds ]
-
-        ends = sts + gap_len * mode_delta
-
-        t_fill_array = np.concatenate ( [ np.arange ( s , e , mode_delta ) for s , e in zip ( sts , ends ) ] , axis = None )
-
-        filled_time_signal = np.zeros ( int ( sum ( gaps ) ) + 1 )
+        n_filled = int ( sum ( gaps ) ) + 1
 
-        filled_time_signal [ ind_list ] = signal
-
-        missing_flag = np.zeros ( int ( sum ( gaps ) ) + 1 )
-
-        missing_flag [ : ] = True 
+        missing_flag = np.ones ( n_filled , dtype = bool )
 
         missing_flag [ ind_list ] = False
 
-        self.missing_flag = missing_flag.astype ( bool )
+        self.missing_flag = missing_flag
 
-        fill_inds = np.where ( filled_time_signal == 0 )
+        last_present = np.cumsum ( ~ missing_flag ) - 1
 
-        filled_time_signal [ fill_inds ] = t_fill_array
+        filled_time_signal = signal [ last_present ] + ( np.arange ( n_filled ) - ind_list [ last_present ] ) * mode_delta
 
         return filled_time_signal
 
 
-    def find_and_fill ( self , signal , gaps , ind_list ) :
+    def find_and_fill ( self , signal , gaps , ind_list , fill_value = 0 ) :
 
         """This does the actuall filling and is called within 
         fill_gaps
@@ -319,13 +345,17 @@ class Eprofile_Reader ( object ) :
         gaps : list 
             sizes of any gaps in data 
         ind_list : list
-            indices where nans are to be inserted
+            indices where the existing data is to be placed
+        fill_value : scalar
+            value given to the missing profiles, 0 by default
 
         Returns
         -------        
 
         filled_signal : array
-            data with columns of nans inserted where data is missing 
+            data with rows of fill_value inserted where data is missing. It 
+            keeps the dtype of signal when filling with 0, otherwise it is at 
+            least float32 so that nan or -999 fit whatever the file's storage type
             
         See also
         --------
@@ -334,17 +364,17 @@ class Eprofile_Reader ( object ) :
 
         """
 
-        if signal.ndim == 1 :
+        if fill_value == 0 :
 
-            filled_signal = np.zeros ( int ( sum ( gaps ) ) + 1  )
+            dtype = signal.dtype
 
-            filled_signal [ ind_list ] = signal
+        else :
 
-        elif signal.ndim == 2 :
+            dtype = np.promote_types ( signal.dtype , np.float32 )
 
-            filled_signal = np.zeros( ( int ( sum ( gaps ) ) + 1 ,  np.shape ( signal ) [ 1 ] ) ) 
+        filled_signal = np.full ( ( int ( sum ( gaps ) ) + 1 , ) + np.shape ( signal ) [ 1 : ] , fill_value , dtype = dtype )
 
-            filled_signal [ ind_list , : ] = signal
+        filled_signal [ ind_list ] = signal
 
         return filled_signal
 
@@ -361,7 +391,7 @@ class Eprofile_Reader ( object ) :
             list of max fitting range after each pre-check
         dt : list of datetime objects
             datetimes for current time window
-        config : class object 
+        config : named tuple 
             object containing varios config thresholds
         variance : float 
             variance at max fitting range after variance check
@@ -384,25 +414,13 @@ class Eprofile_Reader ( object ) :
         """
         
 
-        if ~checks [ 0 ] :
-
-            return 'contains no data' 
-
-        if ~checks [ 1 ] :
-
-            return  'at least one sci~=0'
-
-        if ~checks [ 2 ] :
+        for i , check in enumerate ( checks ) :
 
-            return  'lowest cloud base is ' + str ( round ( max_fit_ranges[0] , 1 ) ) + 'm should be ' + str ( self.config [ 'min_fit_range' ].values [ 0 ] ) + 'm'
+            if not check :
 
-        if ~checks [ 3 ] :
-
-            return 'failed variance check ' + str ( round ( variance , 3 ) ) +  ' at ' + str ( round ( max_fit_ranges[1] , 1 ) ) + 'm'
-
-        if ~checks [ 4 ] :
-
-            return 'failed grad check: X = ' + str ( round ( X , 3 ) ) + ' at ' + str ( round( max_fit_ranges [ 3 ] , 1 ) )  + ' Y = ' + str ( round ( Y, 3 ) ) + ' at ' + str ( round( max_fit_ranges [ 4 ] , 1 ) ) + ' finaly ' + str ( round( max_fit_ranges [ 2 ] , 1 ) ) + 'm'
+                return _PRE_CHECK_MESSAGES [ i ].format ( m0 = round ( max_fit_ranges [ 0 ] , 1 ) , m1 = round ( max_fit_ranges [ 1 ] , 1 ) , m2 = round ( max_fit_ranges [ 2 ] , 1 ) ,
+                                                         m3 = round ( max_fit_ranges [ 3 ] , 1 ) , m4 = round ( max_fit_ranges [ 4 ] , 1 ) , 
+                                                         min_fit_range = config.min_fit_range , variance = round ( variance , 3 ) , X = round ( X , 3 ) , Y = round ( Y , 3 ) )
         
     def write_result_to_csv ( self , save_path ) : 
         
@@ -444,15 +462,11 @@ class Eprofile_Reader ( object ) :
         
         path_n_name = '/'.join ( ( complete_path , results_name ) )
               
-        with open (  path_n_name, 'w+' ) as f :
-        
-            content = f.read ( )
-            
-            for l in meta_data :
+        with open (  path_n_name, 'w' , newline = '' ) as f :
             
-                f.write ( l.rstrip  ('\r\n' ) + '\n' + content )
+            f.writelines ( l.rstrip  ('\r\n' ) + '\n' for l in meta_data )
         
-        results_df.to_csv (  path_n_name , mode = 'a' , index = False )
+            results_df.to_csv ( f , index = False )
           
     def get_final_overlapfunction ( self , save_path ) :
         
@@ -465,7 +479,75 @@ class Eprofile_Reader ( object ) :
 
       
 
-    def loop_over_time ( self , start = None , stop = None ) :
+    def _check_window ( self , s , f , dt , cfg , counts , n_jobs ) :
+
+        """Runs the pre-checks and, if they are passed, the quality checks on 
+        the time window from profile s to f. Called by loop_over_time, 
+        possibly from several threads at once, so nothing on self is changed.
+        
+        Parameters
+        ----------
+        
+        s : int
+            index of the first profile in the window
+        f : int
+            index of the profile ending the window
+        dt : array of datetimes
+            time array passed to loop_over_time
+        cfg : named tuple
+            thresholds and settings, self.config
+        counts : tuple of arrays
+            running counts of the missing and the not clear sky profiles, 
+            each starting from 0, so that the first two pre-checks of 
+            section 1 of the appendix of amt-9-2947-2016 ( at least one 
+            profile present, all profiles clear sky ) only need a difference 
+            of two values per window
+        n_jobs : int
+            number of threads for the gradient calculation in do_quality_checks
+            
+        Returns
+        -------
+        
+        results : dict
+            pre-check results and the data frame of candidate overlap functions
+        """
+
+        results = {}
+
+        n_missing , n_not_clear = counts
+
+        check1 = ( f - s ) - ( n_missing [ f ] - n_missing [ s ] ) > 0
+
+        check2 = check1 and n_not_clear [ f ] == n_not_clear [ s ]
+
+        check3 , max_available_fit_range1 = ffw.enough_clear_range_cbi ( check2 , self.cbh [ s : f , : ] , cfg )
+
+        check4 , max_available_fit_range2 , variance = ffw.running_variance ( check3 , self.rcs_0 [ s : f , : ] , self.rng , dt [ s : f ] , cfg , max_available_fit_range1 )
+
+        check5 , max_available_fit_range , X , Y , m1 , m2 , m3  = ffw.check_grads ( check4 ,  self.rcs_0 [ s : f , : ]  , self.rng , cfg , max_available_fit_range2 )
+
+        max_fit_ranges = [ max_available_fit_range1 , max_available_fit_range2 , max_available_fit_range , m1 , m2 , m3 ]
+
+        if check1 and check2 and check3 and check4 and check5:
+
+            results [ 'pre-check results' ] = 'passed pre-checks. Max range is = ' + str ( round ( max_available_fit_range , 1  ) )  + 'm' 
+            
+            poly_results = fcf.do_quality_checks ( self.rcs_0 [ s : f , : ] , self.rng , self.internal_temperature [ s : f ] , max_available_fit_range , cfg , self.ov , n_jobs = n_jobs )
+            
+            results [ 'data_frame' ] = poly_results
+            
+
+        else:
+            
+            checks = [ check1 , check2 , check3 , check4 , check5 ]
+            
+            results [ 'pre-check results' ] = self.catch_errors ( checks , max_fit_ranges , dt [ s : f ] , cfg , variance , X , Y )
+            
+            results [ 'data_frame' ] = pd.DataFrame(data = [False], columns = ['pass_all'])
+
+        return results
+
+    def loop_over_time ( self , start = None , stop = None , n_jobs = -1 ) :
                 
         """Loop through data with a window 'time_interval_length' wide and 
         shifting by 'd_fit_time' each loop, as defined in config.txt. Because
@@ -483,6 +565,14 @@ class Eprofile_Reader ( object ) :
             index to start from if we are not using whole file
         end : int 
             index to stop at
+        n_jobs : int
+            number of threads used to process the time windows, which are 
+            independent of each other. -1 ( default ) uses one per CPU, 1 
+            processes them in turn. The limit covers both levels of 
+            threading: when windows run in parallel each one computes its 
+            gradients in a single thread, and when they run in turn the 
+            gradients get the same n_jobs, so n_jobs = 1 is single threaded 
+            throughout
         """
 
                                         
@@ -495,10 +585,12 @@ class Eprofile_Reader ( object ) :
             stop = -1
 
         dt = self.dt [ start : stop ] 
+
+        cfg = self.config
          
-        time_interval_length = int ( self.config [ 'time_interval_length' ].values [ 0 ] )
+        time_interval_length = int ( cfg.time_interval_length )
 
-        d_fit_time = int ( self.config [ 'd_fit_time' ].iloc [ 0 ] )
+        d_fit_time = int ( cfg.d_fit_time )
 
         d_fit_time_str = str ( d_fit_time ) + 'min'
 
@@ -506,57 +598,52 @@ class Eprofile_Reader ( object ) :
 
         thirty_time = five_time + datetime.timedelta ( minutes = time_interval_length )
 
-        start_inds = [ np.where ( np.asarray ( dt ) >= f ) [ 0 ] [ 0 ] for f in five_time ]
+        dt_ns = np.asarray ( dt , dtype = 'datetime64[ns]' )
 
-        end_inds = [ np.where ( np.asarray ( dt ) <= f ) [ 0 ] [ -1 ]   for f in thirty_time ]
-        
-        mode_diff = stats.mode ( np.asarray ( end_inds ) - np.asarray ( start_inds ) )
+        start_inds = np.searchsorted ( dt_ns , five_time.values , side = 'left' )
+
+        end_inds = np.searchsorted ( dt_ns , thirty_time.values , side = 'right' ) - 1
         
-        end_inds = np.asarray(start_inds) + mode_diff.mode
+        end_inds = start_inds + _mode_int ( end_inds - start_inds )
         
-        end_inds = end_inds.tolist()
+        start_inds = start_inds.tolist ( )
+
+        end_inds = end_inds.tolist ( )
         
         overlap_functions = np.empty_like ( self.ov )
         
         overlap_functions [ : ] = 0
 
-        for s , f in zip ( start_inds , end_inds ) :
+        last_start = dt [ -1 ] -  datetime.timedelta ( minutes = time_interval_length )
 
-            if dt [ s ] <= ( dt [ -1 ] -  datetime.timedelta ( minutes = time_interval_length ) ) :
-                
-                int_str = 'Interval' + datetime.datetime.strftime ( dt [ s ] , '%H:%M:%S%f' ) + '-' + datetime.datetime.strftime ( dt [ f ] , '%H:%M:%S%f' ) + ' ' +  str ( self.time [ s ] ) + ' to ' + str ( self.time [ f ] ) + ' ' + str ( dt [ s ].date ( ) )
-  
-                results [ int_str ] = {}
+        windows = [ ( s , f ) for s , f in zip ( start_inds , end_inds ) if dt [ s ] <= last_start ]
+
+        counts = ( np.concatenate ( ( [ 0 ] , np.cumsum ( self.missing_flag ) ) ) , np.concatenate ( ( [ 0 ] , np.cumsum ( self.sci != 0 ) ) ) )
+
+        if n_jobs is None or n_jobs < 0 :
+
+            n_jobs = os.cpu_count ( ) or 1
+
+        n_jobs = max ( 1 , min ( n_jobs , len ( windows ) ) )
+
+        if n_jobs == 1 :
 
-                check1 = ffw.at_least_one_profile ( self.missing_flag [ s : f ] )
+            window_results = [ self._check_window ( s , f , dt , cfg , counts , n_jobs ) for s , f in windows ]
 
-                check2 = ffw.all_clear_sky ( check1 ,  self.sci [ s : f ] ) 
+        else :
 
-                check3 , max_available_fit_range1 = ffw.enough_clear_range_cbi ( check2 , self.cbh [ s : f , : ] , self.config )
+            with ThreadPoolExecutor ( max_workers = n_jobs ) as pool :
 
-                check4 , max_available_fit_range2 , variance = ffw.running_variance ( check3 , self.rcs_0 [ s : f , : ] , self.rng , dt [ s : f ] , self.config , max_available_fit_range1 )
+                window_results = list ( pool.map ( lambda w : self._check_window ( *w , dt , cfg , counts , 1 ) , windows ) )
 
-                check5 , max_available_fit_range , X , Y , m1 , m2 , m3  = ffw.check_grads ( check4 ,  self.rcs_0 [ s : f , : ]  , self.rng , self.config , max_available_fit_range2 )
+        stamps = np.datetime_as_string ( dt_ns , unit = 'us' )
 
-                max_fit_ranges = [ max_available_fit_range1 , max_available_fit_range2 , max_available_fit_range , m1 , m2 , m3 ]
+        for ( s , f ) , window_result in zip ( windows , window_results ) :
 
-                if check1 and check2 and check3 and check4 and check5:
+            int_str = 'Interval' + stamps [ s ] [ 11 : 19 ] + stamps [ s ] [ 20 : ] + '-' + stamps [ f ] [ 11 : 19 ] + stamps [ f ] [ 20 : ] + ' ' +  str ( self.time [ s ] ) + ' to ' + str ( self.time [ f ] ) + ' ' + stamps [ s ] [ : 10 ]
 
-                    results [ int_str ] [ 'pre-check results' ] = 'passed pre-checks. Max range is = ' + str ( round ( max_available_fit_range , 1  ) )  + 'm' 
-                    
-                    poly_results = fcf.do_quality_checks ( self.rcs_0 [ s : f , : ] , self.rng , self.internal_temperature [ s : f ] , max_available_fit_range , self.config , self.ov )
-                    
-                    results [ int_str ] [ 'data_frame' ] = poly_results
-                    
+            results [ int_str ] = window_result
 
-                else:
-                    
-                    checks = [ check1 , check2 , check3 , check4 , check5 ]
-                    
-                    results [ int_str ] [ 'pre-check results' ] = self.catch_errors ( checks , max_fit_ranges , dt [ s : f ] , self.config , variance , X , Y )
-                    
-                    results [ int_str ] [ 'data_frame' ] = pd.DataFrame(data = [False], columns = ['pass_all'])
-                    
         self.results = results
         
         self.passed_inds = fs.do_sort_checks ( results , self.dt , self.rng , self.rcs_0 , self.ov , self.config )